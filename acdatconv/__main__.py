@@ -0,0 +1,5 @@
+import sys
+
+from acdatconv.cli import main
+
+sys.exit(main())
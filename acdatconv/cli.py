@@ -0,0 +1,256 @@
+"""
+Command line batch converter
+
+Converts .dat files and folders with AcConv or AdvAcConv and streams one
+record per file as soon as it is converted, so memory use does not grow with
+the number of files.
+
+Usage (from the repository root):
+    python -m acdatconv ./Datas --jobs 4 > meta.ndjson
+    python -m acdatconv ./Datas --format csv -o meta.csv
+    python -m acdatconv ./Datas --converter adv --format archive -o ./archive
+    python -m acdatconv ./incoming --watch -o rolling.ndjson --state watch.json
+
+Formats:
+    ndjson  : one JSON object per line (metadata with the spectra,
+              or metadata_wo_calc with --without-spectrum)
+    csv     : one row of metadata_wo_calc per file
+    archive : columnar spectrum archive (see datarchive.SpectrumArchive),
+              written in parts of --batch-size files
+
+With --watch the folder is watched and new or modified files are appended
+to the output (see datwatch.DatWatcher).
+
+"""
+import argparse
+import csv
+import os
+import sys
+from pathlib import Path
+
+from acdatconv import datconv as dv
+from acdatconv.datjson import dumps
+from acdatconv.datarchive import MANIFEST, SpectrumArchive, write_archive
+from acdatconv.datlib import _map_convert
+from acdatconv.datstats import ConvStats
+
+CONVERTERS = {"ac": dv.AcConv, "adv": dv.AdvAcConv}
+FORMATS = ["ndjson", "csv", "archive"]
+
+
+def collect_files(paths, recursive=False):
+    """.dat files given directly or found in folders (sorted per folder).
+
+    Args:
+        paths (list[str]): files and folders
+        recursive (bool, optional): Also search sub folders. Defaults to False.
+
+    Returns:
+        list[pathlib.Path]: dat files
+    """
+    files = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            files.extend(sorted(p.rglob('*.dat') if recursive else p.glob('*.dat')))
+        else:
+            files.append(p)
+    return files
+
+
+class NdjsonWriter():
+    """Writes one JSON object per line."""
+    def __init__(self, out, without_spectrum=False):
+        self.out = out
+        self.without_spectrum = without_spectrum
+        # the converters only build the spectrum lists when a writer uses them
+        self.with_spectrum = not without_spectrum
+
+    def write(self, meta, meta_wo):
+        record = meta_wo if self.without_spectrum else meta
+        self.out.write(dumps(record, ensure_ascii=False, strict=True) + "\n")
+        self.out.flush()
+
+    def close(self):
+        pass
+
+
+class CsvWriter():
+    """Writes one row of metadata_wo_calc per file (header from the first record,
+    not written when header is False, e.g. when appending)."""
+    with_spectrum = False
+
+    def __init__(self, out, header=True):
+        self.out = out
+        self.header = header
+        self.writer = None
+
+    def write(self, meta, meta_wo):
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.out, fieldnames=list(meta_wo), lineterminator="\n")
+            if self.header:
+                self.writer.writeheader()
+        self.writer.writerow(meta_wo)
+        self.out.flush()
+
+    def close(self):
+        pass
+
+
+class ArchiveWriter():
+    """Writes the records to a columnar archive, one part per batch_size files
+    (or per flush()). With append, an existing archive is continued. Above
+    max_parts parts the archive is compacted into one part (zero-copy reads)."""
+    with_spectrum = True
+
+    def __init__(self, out_dir, batch_size=1000, append=False, max_parts=None):
+        self.out_dir = Path(out_dir)
+        self.batch_size = batch_size
+        self.max_parts = max_parts
+        self.archive = None
+        if append and (self.out_dir / MANIFEST).exists():
+            self.archive = SpectrumArchive(self.out_dir)
+        self.records = []
+
+    def write(self, meta, meta_wo):
+        self.records.append(meta)
+        if len(self.records) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.archive is None:
+            self.archive = write_archive(self.records, self.out_dir)
+        elif self.records:
+            self.archive.append(self.records)
+            if self.max_parts is not None and len(self.archive.manifest["parts"]) > self.max_parts:
+                self.archive.compact()
+        self.records = []
+
+    def close(self):
+        self.flush()
+
+
+def convert_stream(files, writer, converter=dv.AcConv, jobs=1, stats=None, err=sys.stderr):
+    """Converts files and passes each record to the writer in the input order.
+
+    Args:
+        files (list): dat files
+        writer (NdjsonWriter, CsvWriter or ArchiveWriter): output
+        converter (class, optional): AcConv or AdvAcConv. Defaults to AcConv.
+        jobs (int, optional): Number of worker processes, None uses all CPUs. Defaults to 1.
+        stats (ConvStats, optional): Collect the stage times. Defaults to None.
+        err (file, optional): Stream for the error messages. Defaults to sys.stderr.
+
+    Returns:
+        tuple (int, int): converted files, files with errors
+    """
+    n_ok = n_err = 0
+    for fl, meta_, meta_wo, error, _, f_stats in _map_convert(files, converter, jobs,
+                                                               with_stats=stats is not None,
+                                                               with_spectrum=getattr(writer, "with_spectrum", True)):
+        if f_stats is not None:
+            stats.merge(f_stats)
+        if error is not None:
+            print(f'file error: {Path(fl).name} ({error})', file=err)
+            n_err += 1
+            continue
+        writer.write(meta_, meta_wo)
+        n_ok += 1
+    writer.close()
+    return n_ok, n_err
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m acdatconv",
+                                     description="Convert AC series .dat files to NDJSON, CSV or a columnar archive")
+    parser.add_argument("paths", nargs="+", help=".dat files or folders")
+    parser.add_argument("-r", "--recursive", action="store_true", help="search sub folders")
+    parser.add_argument("-c", "--converter", choices=list(CONVERTERS), default="ac",
+                        help="ac: AcConv, adv: AdvAcConv (trimmed at the reliable range)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="worker processes (0: all CPUs)")
+    parser.add_argument("-f", "--format", choices=FORMATS, default="ndjson", help="output format")
+    parser.add_argument("-o", "--output", help="output file (archive: folder). Defaults to stdout")
+    parser.add_argument("--without-spectrum", action="store_true",
+                        help="ndjson: write metadata_wo_calc only")
+    parser.add_argument("--batch-size", type=int, default=1000, help="archive: files per part")
+    parser.add_argument("--stats", action="store_true", help="print the stage times to stderr")
+    parser.add_argument("--watch", action="store_true",
+                        help="watch the folder and append new or modified files to the output")
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="watch: seconds without change before a file is converted")
+    parser.add_argument("--interval", type=float, default=1.0, help="watch: seconds between checks")
+    parser.add_argument("--state", help="watch: state file of the converted files (restart without duplicates)")
+    parser.add_argument("--skip-existing", action="store_true", help="watch: do not convert files present at start")
+    parser.add_argument("--poll", action="store_true", help="watch: scan the folder even if watchdog is installed")
+    parser.add_argument("--flush-interval", type=float, default=60.0,
+                        help="watch, archive: seconds between archive parts (and state saves)")
+    parser.add_argument("--max-parts", type=int, default=32,
+                        help="watch, archive: compact the archive above this number of parts")
+    args = parser.parse_args(argv)
+
+    if args.watch:
+        return _watch(parser, args)
+
+    files = collect_files(args.paths, args.recursive)
+    stats = ConvStats() if args.stats else None
+    jobs = args.jobs or None
+
+    if args.format == "archive":
+        if args.output is None:
+            parser.error("--format archive needs --output (archive folder)")
+        out = None
+        writer = ArchiveWriter(args.output, args.batch_size)
+    else:
+        out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+        if args.format == "csv":
+            writer = CsvWriter(out)
+        else:
+            writer = NdjsonWriter(out, args.without_spectrum)
+
+    try:
+        n_ok, n_err = convert_stream(files, writer, CONVERTERS[args.converter], jobs, stats)
+    except BrokenPipeError:
+        # the reader (e.g. head) has stopped: drop the rest of the output quietly
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    finally:
+        if out is not None and out is not sys.stdout:
+            out.close()
+
+    print(f'converted: {n_ok}, errors: {n_err}', file=sys.stderr)
+    if stats is not None:
+        print(stats.summary(), file=sys.stderr)
+    return 1 if n_err and not n_ok else 0
+
+
+def _watch(parser, args):
+    from acdatconv.datwatch import DatWatcher
+
+    if len(args.paths) != 1 or not Path(args.paths[0]).is_dir():
+        parser.error("--watch needs one folder")
+    if args.format == "archive":
+        if args.output is None:
+            parser.error("--format archive needs --output (archive folder)")
+        out = None
+        writer = ArchiveWriter(args.output, args.batch_size, append=True, max_parts=args.max_parts)
+        # one part per flush: collect the files of several rounds
+        flush_interval = args.flush_interval
+    else:
+        # the output is only appended to
+        exists = args.output is not None and Path(args.output).exists() and Path(args.output).stat().st_size > 0
+        flush_interval = 0.0
+        out = open(args.output, "a", encoding="utf-8", newline="") if args.output else sys.stdout
+        if args.format == "csv":
+            writer = CsvWriter(out, header=not exists)
+        else:
+            writer = NdjsonWriter(out, args.without_spectrum)
+
+    watcher = DatWatcher(args.paths[0], writer, CONVERTERS[args.converter], settle=args.settle,
+                         interval=args.interval, recursive=args.recursive, state_file=args.state,
+                         skip_existing=args.skip_existing, use_events=not args.poll,
+                         flush_interval=flush_interval)
+    try:
+        watcher.run()
+    finally:
+        if out is not None and out is not sys.stdout:
+            out.close()
+    return 0
@@ -0,0 +1,220 @@
+"""
+Columnar spectrum archive
+
+All converted spectra and scalar metadata of a folder are stored as one .npy
+file per column, so a single column (e.g. nayield of every file) can be read
+memory-mapped without loading anything else.
+
+Layout:
+    archive_dir/
+        manifest.json          # parts and column names
+        part-00000/
+            offsets.npy        # spectrum i is [offsets[i]:offsets[i+1]]
+            uvEnergy.npy ...   # spectrum columns, all files concatenated
+            sampleName.npy ... # scalar columns, one value per file
+
+Appending writes a new part; earlier parts are never rewritten.
+
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+
+from acdatconv import datconv as dv
+
+ARCHIVE_FORMAT = 1
+MANIFEST = "manifest.json"
+
+# One value per energy point
+SPECTRUM_COLUMNS = list(dv.AcConv.calc_data_keys)
+# One value per file
+SCALAR_COLUMNS = list(dv.AcConv.meta_keys) + ["thresholdEnergy", "slope", "yslice", "bg", "file_name"]
+
+
+def _split_record(rec):
+    """Returns (scalar dict, spectrum dict) of a converted AcConv or a metadata dict."""
+    if isinstance(rec, dv.AcConv):
+        return rec.metadata_wo_calc, rec.calcdata
+    return rec, rec
+
+
+class SpectrumArchive():
+    """Reads (and appends to) a columnar spectrum archive.
+
+    Args:
+        path (str or pathlib): archive folder
+        mmap_mode (str, optional): mode passed to numpy.load. Defaults to 'r'.
+
+    Example :
+        >>> write_archive(records, './archive')
+        >>> arc = SpectrumArchive('./archive')
+        >>> nayield = arc.column('nayield')       # memory-mapped, all files
+        >>> arc.spectrum(3, 'nayield')            # view of file 3
+        >>> arc.column('thresholdEnergy')         # one value per file
+    """
+    def __init__(self, path, mmap_mode="r"):
+        self.path = Path(path)
+        self.mmap_mode = mmap_mode
+        self.manifest = json.loads((self.path / MANIFEST).read_text(encoding="utf-8"))
+        self.spectrum_columns = self.manifest["spectrum_columns"]
+        self.scalar_columns = self.manifest["scalar_columns"]
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _load_part(self, part, name):
+        return np.load(self.path / part / f"{name}.npy", mmap_mode=self.mmap_mode)
+
+    def _column_parts(self, name):
+        return [self._load_part(part, name) for part in self.manifest["parts"]]
+
+    @property
+    def offsets(self):
+        """numpy.ndarray: start of each spectrum in the spectrum columns (length len+1)"""
+        if "offsets" not in self._cache:
+            parts = self._column_parts("offsets")
+            if len(parts) == 1:
+                offsets = parts[0]
+            else:
+                starts = np.cumsum([0] + [p[-1] for p in parts[:-1]])
+                offsets = np.concatenate([parts[0]] + [p[1:] + s for p, s in zip(parts[1:], starts[1:])])
+            self._cache["offsets"] = offsets
+        return self._cache["offsets"]
+
+    def column(self, name):
+        """One column of all files.
+
+        A single-part archive returns the memory-mapped array (no copy).
+        Archives with appended parts are concatenated once; call compact()
+        to get zero-copy reads again.
+
+        Args:
+            name (str): spectrum or scalar column name
+
+        Returns:
+            numpy.ndarray: concatenated spectra or one value per file
+        """
+        if name not in self.spectrum_columns and name not in self.scalar_columns:
+            raise KeyError(f"Unknown column: {name}")
+        if name not in self._cache:
+            parts = self._column_parts(name)
+            self._cache[name] = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        return self._cache[name]
+
+    def spectrum(self, i, name=None):
+        """Spectrum columns of one file (views of the memory-mapped columns).
+
+        Args:
+            i (int): file number
+            name (str, optional): column name. Defaults to None (all spectrum columns).
+
+        Returns:
+            numpy.ndarray or dict[numpy.ndarray]
+        """
+        sl = slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+        if name is not None:
+            return self.column(name)[sl]
+        return {c: self.column(c)[sl] for c in self.spectrum_columns}
+
+    def split(self, name):
+        """Spectrum column split per file.
+
+        Returns:
+            list[numpy.ndarray]: views, one per file
+        """
+        return np.split(self.column(name), self.offsets[1:-1])
+
+    def scalars(self):
+        """Scalar metadata of all files as a DataFrame.
+
+        Returns:
+            DataFrame
+        """
+        import pandas as pd
+        return pd.DataFrame({c: np.asarray(self.column(c)) for c in self.scalar_columns})
+
+    def _next_part(self):
+        last = max(int(p.split("-")[1]) for p in self.manifest["parts"])
+        return f"part-{last + 1:05d}"
+
+    def append(self, records):
+        """Writes records as a new part.
+
+        Args:
+            records (list): converted AcConv objects or metadata dicts
+        """
+        part = self._next_part()
+        _write_part(self.path / part, records)
+        self.manifest["parts"].append(part)
+        _write_manifest(self.path, self.manifest)
+        self._cache = {}
+
+    def compact(self):
+        """Merges all parts into one so that column() is zero-copy again."""
+        if len(self.manifest["parts"]) < 2:
+            return
+        old_parts = list(self.manifest["parts"])
+        part = self._next_part()
+        (self.path / part).mkdir()
+        for name in self.spectrum_columns + self.scalar_columns:
+            np.save(self.path / part / f"{name}.npy", np.concatenate(self._column_parts(name)))
+        np.save(self.path / part / "offsets.npy", np.asarray(self.offsets))
+        self.manifest["parts"] = [part]
+        _write_manifest(self.path, self.manifest)
+        self._cache = {}
+        for old in old_parts:
+            for f in (self.path / old).iterdir():
+                f.unlink()
+            (self.path / old).rmdir()
+
+
+def _write_manifest(path, manifest):
+    tmp = Path(path) / (MANIFEST + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    tmp.replace(Path(path) / MANIFEST)
+
+
+def _write_part(part_dir, records):
+    part_dir = Path(part_dir)
+    part_dir.mkdir(parents=True)
+    scalars = {c: [] for c in SCALAR_COLUMNS}
+    spectra = {c: [] for c in SPECTRUM_COLUMNS}
+    lengths = []
+    for rec in records:
+        meta, calc = _split_record(rec)
+        for c in SCALAR_COLUMNS:
+            scalars[c].append(meta[c])
+        for c in SPECTRUM_COLUMNS:
+            spectra[c].append(np.asarray(calc[c]))
+        lengths.append(len(spectra[SPECTRUM_COLUMNS[0]][-1]))
+
+    np.save(part_dir / "offsets.npy", np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]))
+    for c, values in spectra.items():
+        data = np.concatenate(values) if values else np.empty(0)
+        np.save(part_dir / f"{c}.npy", data)
+    for c, values in scalars.items():
+        # str columns become fixed width unicode arrays, still memory-mappable
+        np.save(part_dir / f"{c}.npy", np.asarray(values))
+
+
+def write_archive(records, out_dir):
+    """Writes converted spectra and scalar metadata as a columnar archive.
+
+    Args:
+        records (list): converted AcConv objects or metadata dicts (acdata.metadata)
+        out_dir (str or pathlib): archive folder (must not exist or be empty)
+
+    Returns:
+        SpectrumArchive: the written archive
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if any(out_dir.iterdir()):
+        raise FileExistsError(f"Archive folder is not empty: {out_dir}")
+    _write_part(out_dir / "part-00000", records)
+    manifest = {"format": ARCHIVE_FORMAT, "parts": ["part-00000"],
+                "spectrum_columns": SPECTRUM_COLUMNS, "scalar_columns": SCALAR_COLUMNS}
+    _write_manifest(out_dir, manifest)
+    return SpectrumArchive(out_dir)
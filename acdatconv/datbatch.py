@@ -0,0 +1,214 @@
+"""
+Batch conversion of many AC .dat files
+
+The spectra of many files are stacked into padded 2D arrays (one row per
+file) and the counting, photon and power calibrations of AcConv are applied
+to all rows at once.
+
+"""
+from pathlib import Path
+
+import numpy as np
+
+from acdatconv import datconv as dv
+from acdatconv.datfit import auto_threshold_batch, fit_threshold_batch, masked_nanmean
+
+# Models whose counting rate is already dead-time corrected
+NO_COUNT_CALIBRATION = ["AC-2", "AC-3"]
+
+
+class AcBatch():
+    """Batch version of AcConv for many .dat files.
+
+    Spectrum arrays are 2D (files x energy points), padded with NaN
+    (flags with 0) after the last point of each file. mask is True for
+    valid points. Parameters such as deadTime or powerNumber are 1D arrays
+    with one value per file.
+
+    Args:
+        file_names (list): .dat filenames
+
+    Example :
+        >>> batch = AcBatch(Path('./data').glob('*.dat'))
+        >>> batch.convert()
+        >>> batch.npyield.shape        # (files, max points)
+        >>> batch.spectrum(0, 'npyield')
+        >>> batch.errors               # files that could not be read
+    """
+    # Per-file parameters stacked into 1D arrays
+    param_keys = ["deadTime", "countingTime", "powerNumber", "anodeVoltage", "step",
+                  "flagDifDataGroundLevel", "bgCountingRate", "uvIntensity59", "sensitivity1"]
+    # Spectrum columns read from the files
+    data_keys = ["uvEnergy", "countingRate", "flGrandLevel", "flRegLevel", "uvIntensity"]
+
+    def __init__(self, file_names):
+        convs = []
+        self.errors = {}
+        for fl in file_names:
+            acdata = dv.AcConv(fl)
+            try:
+                acdata._read_para()
+            except Exception as e:
+                self.errors[Path(fl).name] = f'{type(e).__name__}: {e}'
+                continue
+            convs.append(acdata)
+        self._stack(convs)
+
+    @classmethod
+    def from_convs(cls, convs):
+        """Builds a batch from AcConv objects that have been read (or converted).
+
+        Args:
+            convs (list[AcConv]): AcConv objects
+
+        Returns:
+            AcBatch
+        """
+        batch = cls.__new__(cls)
+        batch.errors = {}
+        batch._stack(list(convs))
+        return batch
+
+    def _stack(self, convs):
+        self.file_name = [c.file_name for c in convs]
+        self.model = np.array([c.model for c in convs], dtype=str)
+        self.sampleName = [c.sampleName for c in convs]
+        for key in self.param_keys:
+            setattr(self, key, np.array([getattr(c, key) for c in convs], dtype=float))
+        self.flagDifDataGroundLevel = self.flagDifDataGroundLevel.astype(int)
+
+        self.lengths = np.array([len(c.uvEnergy) for c in convs], dtype=int)
+        width = int(self.lengths.max()) if len(convs) else 0
+        self.mask = np.arange(width) < self.lengths[:, None]
+        for key in self.data_keys:
+            fill = 0 if key in ("flGrandLevel", "flRegLevel") else np.nan
+            dtype = int if fill == 0 else float
+            arr = np.full((len(convs), width), fill, dtype=dtype)
+            # one assignment for all rows through the mask
+            if len(convs):
+                arr[self.mask] = np.concatenate([getattr(c, key) for c in convs])
+            setattr(self, key, arr)
+
+    def __len__(self):
+        return len(self.file_name)
+
+    def convert(self):
+        """Applies the calibrations and the user threshold fit to all spectra."""
+        self.countingCorrection = self._count_calibration()
+        self.photonCorrection = self._photon_calibration()
+        self.ydata, self.npyield = self._pyield_intensity()
+        self.user_estimation()
+
+    def _count_calibration(self):
+        """Performs counting rate calibration for all files.
+
+        Rows of "AC-3" and "AC-2" data are not calibrated.
+
+        Returns:
+            numpy.ndarray: Calibrated counting rate (2D)
+        """
+        cr = self.countingRate
+        calib = ~np.isin(self.model, NO_COUNT_CALIBRATION)
+        cc = cr.copy()
+        if calib.any():
+            c = cr[calib]
+            dt = self.deadTime[calib, None]
+            s1 = self.sensitivity1[calib, None]
+            bg = self.bgCountingRate[calib, None]
+            part1 = c/(1-dt*c)
+            part2 = np.exp(0.13571/(1-0.0028*c))*s1
+            part3 = bg/(1-dt*bg)
+            part4 = np.exp(0.13571/(1-0.0028*bg))*s1
+            cc[calib] = part1*part2-part3*part4
+        self.countingCorrection = cc
+        return self.countingCorrection
+
+    def _photon_calibration(self):
+        """Performs photon number calibration for all files.
+
+        Returns:
+            numpy.ndarray: Calibrated photon number (2D)
+        """
+        self.nPhoton = 0.625*(self.uvIntensity/self.uvEnergy)
+        self.unitPhoton = (self.uvIntensity59*0.625)/5.9
+        self.photonCorrection = self.nPhoton/self.unitPhoton[:, None]
+        return self.photonCorrection
+
+    def _pyield_intensity(self):
+        """Calculates PYS intensity for all files.
+
+        Returns:
+            tuple (numpy.ndarray, numpy.ndarray): ydata, npyield (2D)
+        """
+        self.ydata = self.countingCorrection/self.photonCorrection
+        # Replace negative values with 0
+        self.ydata = np.where(self.ydata < 0, 0, self.ydata)
+        self.npyield = np.power(self.ydata, self.powerNumber[:, None])
+        # replace Nan with 0, keep NaN in the padding
+        self.npyield[np.isnan(self.npyield) & self.mask] = 0
+        return self.ydata, self.npyield
+
+    def user_estimation(self):
+        """Estimates the threshold values analyzed by the user for all files at once.
+
+        Same as AcConv.user_estimation, including the background subtraction of
+        files with flagDifDataGroundLevel == -1. Files without flags get NaN.
+        After changing powerNumber, call _pyield_intensity() and this method to refit.
+
+        Returns:
+            dict[numpy.ndarray]: 'thresholdEnergy', 'slope','yslice','bg'
+        """
+        bg_mask = (self.flGrandLevel == -1) & self.mask
+        reg_mask = (self.flRegLevel == -1) & self.mask
+        has_flags = bg_mask.any(axis=1) & reg_mask.any(axis=1)
+        dif = (self.flagDifDataGroundLevel == -1)[:, None]
+        power = self.powerNumber[:, None]
+
+        # Calibration of background difference
+        bg_ave = masked_nanmean(self.ydata, bg_mask)[:, None]
+        c_pys = self.ydata - bg_ave
+        c_pys = np.where(c_pys < 0, 0, c_pys)
+        self.cc_pys = np.where(dif, c_pys, self.ydata)
+        self.cc_npys = np.power(self.cc_pys, power)
+        bg_ydata = np.where(dif, 0.0, self.cc_npys)
+
+        self.estimate_value = fit_threshold_batch(self.uvEnergy, self.cc_npys, reg_mask & has_flags[:, None],
+                                                  bg_ydata, bg_mask & has_flags[:, None])
+        self.nayield = np.where(has_flags[:, None], self.cc_npys, self.npyield)
+        est = self.estimate_value
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.guideline = dv.AcConv.relu(xdata=self.uvEnergy, a=est['slope'][:, None],
+                                            b=est['yslice'][:, None], bg=est['bg'][:, None])
+        return self.estimate_value
+
+    def auto_estimation(self, refine=False):
+        """Estimates the thresholds of all files without the user flags
+        (see datfit.auto_threshold_batch). As in AcConv.auto_estimation, points from
+        the first one above the energy limit or the counting ceiling of the model on
+        are not used.
+
+        Args:
+            refine (bool, optional): Refine each result with scipy curve_fit. Defaults to False.
+
+        Returns:
+            dict[numpy.ndarray]: 'thresholdEnergy', 'slope','yslice','bg'
+        """
+        limits = dv.AcConv.count_limits
+        count_limit = np.array([limits.get(m, dv.AcConv.default_count_limit) for m in self.model], dtype=float)
+        with np.errstate(invalid="ignore"):
+            cut = (self.uvEnergy >= dv.AcConv.limit_energy) | (self.countingCorrection >= count_limit[:, None])
+        mask = self.mask & ~np.logical_or.accumulate(cut, axis=1)
+        self.auto_estimate_value = auto_threshold_batch(self.uvEnergy, self.npyield, mask, refine=refine)
+        return self.auto_estimate_value
+
+    def spectrum(self, i, name):
+        """Valid points of one file.
+
+        Args:
+            i (int): file number
+            name (str): array name (e.g. 'npyield')
+
+        Returns:
+            numpy.ndarray: view of the row without padding
+        """
+        return getattr(self, name)[i, :self.lengths[i]]
@@ -0,0 +1,341 @@
+"""
+Persistent conversion cache for AC .dat files
+
+Converted AcConv / AdvAcConv objects are stored on disk so that a rescan of
+an unchanged folder does not parse and fit every file again.
+
+Each entry is one .npz file: the arrays, and the other values as a JSON
+string. Entries are read with allow_pickle=False, so a cache folder on a
+shared drive cannot make the converter run code.
+
+"""
+import hashlib
+import inspect
+import json
+import os
+import time
+from pathlib import Path
+import zipfile
+
+import numpy as np
+
+from acdatconv import datconv as dv
+
+# The cache is invalidated whenever the conversion code changes.
+CODE_VERSION = hashlib.sha1(Path(dv.__file__).read_bytes()).hexdigest()[:12]
+
+# Attributes rebuilt by _make_metadata() (or on first access), the stats hook and
+# in-memory file contents (AcConv.from_bytes) are not stored.
+DERIVED_KEYS = ("metadata_wo_calc", "_metadata", "_calcdata", "_json", "_df", "stats", "_raw")
+
+
+def conv_state(acdata):
+    """Returns the converted state of an AcConv object that is worth caching.
+
+    Args:
+        acdata (AcConv): converted object
+
+    Returns:
+        dict: attribute name -> value (arrays, parameters and estimate values)
+    """
+    return {k: v for k, v in vars(acdata).items() if k not in DERIVED_KEYS}
+
+
+# npz member with the JSON encoded values that are not arrays
+SCALARS_KEY = "__scalars__"
+# Per-instance settings that change the converted result (AdvAcConv trimming)
+SETTING_KEYS = ("limit_energy", "limit_count")
+
+
+def conv_settings(converter, values=None):
+    """Effective settings of a converter: the defaults of its __init__,
+    updated with the given values.
+
+    Args:
+        converter (class): AcConv or AdvAcConv
+        values (dict, optional): settings (or a converted state). Defaults to None.
+
+    Returns:
+        dict: SETTING_KEYS accepted by the converter -> value
+    """
+    params = inspect.signature(converter.__init__).parameters
+    settings = {k: params[k].default for k in SETTING_KEYS if k in params}
+    settings.update({k: v for k, v in (values or {}).items() if k in settings})
+    return settings
+
+
+def _kind(converter, settings):
+    """Converter name, with a short hash of the settings when it has any."""
+    if not settings:
+        return converter.__name__
+    text = json.dumps(settings, sort_keys=True, default=str)
+    return f"{converter.__name__}-{hashlib.sha1(text.encode()).hexdigest()[:8]}"
+
+
+def _json_default(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+
+def _unlink(path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def write_state(path, state):
+    """Writes a converted state to an .npz file (no pickled objects).
+
+    Args:
+        path (pathlib.Path): entry file
+        state (dict): state returned by conv_state()
+    """
+    arrays = {k: v for k, v in state.items()
+              if isinstance(v, np.ndarray) and not v.dtype.hasobject}
+    scalars = {k: str(v) if isinstance(v, Path) else v for k, v in state.items() if k not in arrays}
+    paths = [k for k, v in state.items() if isinstance(v, Path)]
+    arrays[SCALARS_KEY] = np.array(json.dumps({"values": scalars, "paths": paths}, default=_json_default))
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+
+
+def read_state(path):
+    """Reads a state written by write_state().
+
+    Args:
+        path (pathlib.Path): entry file
+
+    Returns:
+        dict: converted state
+    """
+    with np.load(path, allow_pickle=False) as npz:
+        state = {k: npz[k] for k in npz.files if k != SCALARS_KEY}
+        scalars = json.loads(str(npz[SCALARS_KEY]))
+    state.update(scalars["values"])
+    for k in scalars["paths"]:
+        state[k] = Path(state[k])
+    return state
+
+
+def restore_conv(state, converter=dv.AcConv, file_name=None):
+    """Rebuilds a converted object from a cached state without reading the file.
+
+    Args:
+        state (dict): state returned by conv_state()
+        converter (class, optional): AcConv or AdvAcConv. Defaults to AcConv.
+        file_name (str, optional): file name to set (the cached entry may come
+            from a copy of the file with another name). Defaults to None.
+
+    Returns:
+        AcConv: converted object
+    """
+    acdata = converter.__new__(converter)
+    acdata.__dict__.update(state)
+    if file_name is not None:
+        acdata.file_name = Path(file_name)
+    acdata._make_metadata()
+    return acdata
+
+
+class ConvCache():
+    """On-disk cache of converted dat files.
+
+    Entries are looked up by path + size + mtime. When these do not match
+    (e.g. the file was copied or touched), the content hash is used instead.
+    Each entry records the converter class, its settings (limit_energy,
+    limit_count of AdvAcConv) and CODE_VERSION that produced it, and the least
+    recently used entries are removed above max_size.
+
+    Args:
+        cache_dir (str or pathlib): cache folder
+        max_size (int, optional): maximum total size of the entries in bytes.
+            Defaults to 1 GB.
+
+    Example :
+        >>> cache = ConvCache('./dat_cache')
+        >>> acdata = cache.convert('./datafile.dat', AdvAcConv)
+        >>> acdata = cache.convert('./datafile.dat', AdvAcConv, limit_energy=6.5)
+        >>> cache.flush()
+    """
+    index_name = "index.json"
+
+    def __init__(self, cache_dir, max_size=1024**3):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.index_file = self.cache_dir / self.index_name
+        self._hash_memo = {}
+        self._dirty = False
+        self._load_index()
+        # the cache may be reopened with a smaller max_size
+        self._evict()
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    def _load_index(self):
+        try:
+            index = json.loads(self.index_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            index = {}
+        # entries: entry id -> {"cls", "kind", "version", "size", "atime"}
+        # files: "kind|path" -> [size, mtime_ns, entry id]  (kind: class name + settings hash)
+        self.entries = index.get("entries", {})
+        self.files = index.get("files", {})
+
+    def flush(self):
+        """Removes the entries above max_size and writes the index to disk."""
+        self._evict()
+        if not self._dirty:
+            return
+        tmp = self.index_file.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"entries": self.entries, "files": self.files}),
+                       encoding="utf-8")
+        os.replace(tmp, self.index_file)
+        self._dirty = False
+
+    def _entry_path(self, entry_id):
+        return self.cache_dir / f"{entry_id}.npz"
+
+    def _content_hash(self, fl):
+        key = str(fl)
+        if key not in self._hash_memo:
+            self._hash_memo[key] = hashlib.sha256(fl.read_bytes()).hexdigest()
+        return self._hash_memo[key]
+
+    def _valid(self, entry_id, kind):
+        entry = self.entries.get(entry_id)
+        return (entry is not None and entry.get("kind") == kind
+                and entry["version"] == CODE_VERSION
+                and self._entry_path(entry_id).exists())
+
+    def _lookup(self, fl, kind):
+        """Returns the entry id for a file, or None."""
+        st = fl.stat()
+        file_key = f"{kind}|{fl}"
+        rec = self.files.get(file_key)
+        if rec is not None and rec[:2] == [st.st_size, st.st_mtime_ns] and self._valid(rec[2], kind):
+            return rec[2]
+
+        # fallback: the same content may already be cached
+        entry_id = f"{self._content_hash(fl)}-{kind}"
+        if self._valid(entry_id, kind):
+            self.files[file_key] = [st.st_size, st.st_mtime_ns, entry_id]
+            self._hash_memo.pop(str(fl), None)
+            self._dirty = True
+            return entry_id
+        return None
+
+    def load(self, file_name, converter=dv.AcConv, **settings):
+        """Returns the cached converted object, or None if it is not cached.
+
+        Args:
+            file_name (str or pathlib): dat file
+            converter (class, optional): AcConv or AdvAcConv. Defaults to AcConv.
+            **settings: converter settings (limit_energy, limit_count), defaults if not given
+
+        Returns:
+            AcConv: converted object or None
+        """
+        fl = Path(file_name).resolve()
+        entry_id = self._lookup(fl, _kind(converter, conv_settings(converter, settings)))
+        if entry_id is None:
+            return None
+        try:
+            state = read_state(self._entry_path(entry_id))
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            self._remove(entry_id)
+            return None
+
+        self.entries[entry_id]["atime"] = time.time()
+        self._dirty = True
+        return restore_conv(state, converter, file_name)
+
+    def save_state(self, file_name, converter, state):
+        """Stores a converted state (see conv_state()) for a file.
+
+        Args:
+            file_name (str or pathlib): dat file
+            converter (class): class that produced the state
+            state (dict): converted state
+        """
+        fl = Path(file_name).resolve()
+        st = fl.stat()
+        kind = _kind(converter, conv_settings(converter, state))
+        entry_id = f"{self._content_hash(fl)}-{kind}"
+        path = self._entry_path(entry_id)
+        write_state(path, state)
+
+        self.entries[entry_id] = {"cls": converter.__name__, "kind": kind, "version": CODE_VERSION,
+                                  "size": path.stat().st_size, "atime": time.time()}
+        self.files[f"{kind}|{fl}"] = [st.st_size, st.st_mtime_ns, entry_id]
+        self._hash_memo.pop(str(fl), None)
+        self._dirty = True
+        self._evict()
+
+    def save(self, acdata):
+        """Stores a converted AcConv / AdvAcConv object.
+
+        Args:
+            acdata (AcConv): converted object
+        """
+        self.save_state(acdata.file_name, type(acdata), conv_state(acdata))
+
+    def convert(self, file_name, converter=dv.AcConv, **settings):
+        """Returns the cached object, converting and storing the file on a miss.
+
+        Args:
+            file_name (str or pathlib): dat file
+            converter (class, optional): AcConv or AdvAcConv. Defaults to AcConv.
+            **settings: converter settings (limit_energy, limit_count)
+
+        Returns:
+            AcConv: converted object
+        """
+        acdata = self.load(file_name, converter, **settings)
+        if acdata is None:
+            acdata = converter(file_name, **settings)
+            acdata.convert()
+            self.save(acdata)
+        return acdata
+
+    def _remove(self, entry_id):
+        self.entries.pop(entry_id, None)
+        _unlink(self._entry_path(entry_id))
+        self.files = {k: v for k, v in self.files.items() if v[2] != entry_id}
+        self._dirty = True
+
+    def _evict(self):
+        """Removes least recently used entries above max_size."""
+        total = sum(e["size"] for e in self.entries.values())
+        if total <= self.max_size:
+            return
+        removed = set()
+        for entry_id, entry in sorted(self.entries.items(), key=lambda kv: kv[1]["atime"]):
+            if total <= self.max_size:
+                break
+            total -= entry["size"]
+            removed.add(entry_id)
+            _unlink(self._entry_path(entry_id))
+        self.entries = {k: v for k, v in self.entries.items() if k not in removed}
+        self.files = {k: v for k, v in self.files.items() if v[2] not in removed}
+        self._dirty = True
+
+    def clear(self):
+        """Removes all entries."""
+        for entry_id in list(self.entries):
+            _unlink(self._entry_path(entry_id))
+        self.entries = {}
+        self.files = {}
+        self._dirty = True
+        self.flush()
@@ -3,35 +3,173 @@ AC Series Data Converter
 
 """
 import csv
-import json
 from pathlib import Path
 
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
+# pandas and matplotlib are imported where they are used (df, plot_ax),
+# so that reading and fitting only need NumPy.
 
-def getEncode(filepath):
-    """Automatically determines the encoding of a file.
-     If the file name contains Japanese, the encoding method may be Shift-jis.
-     Function that returns the encoding method.
+from acdatconv import datjson
+from acdatconv.datfit import auto_threshold_batch
+from acdatconv.datstats import NULL_STAGE
+
+ENCODINGS = ["iso-2022-jp", "euc-jp", "shift_jis", "utf-8"]
+
+# Only the first three lines (parameters, date/sampleName, light settings)
+# can contain non-ASCII characters. The spectrum block is plain ASCII.
+HEADER_LINES = 3
+
+
+def detect_encoding(raw, filepath=None):
+    """Determines the encoding of .dat file contents already read into memory.
+     Only the header lines are tried against each candidate encoding,
+     because the sample name is the only part that may contain Japanese.
 
     Args:
-        filepath (str): fil path and name
+        raw (bytes): file contents
+        filepath (str, optional): file name used in the error message
 
     Returns:
         encode type(str): encode type
     """
-    encodings = ["iso-2022-jp", "euc-jp", "shift_jis", "utf-8"]
-    for encoding in encodings:
+    head = b"\n".join(raw.split(b"\n", HEADER_LINES)[:HEADER_LINES])
+    for encoding in ENCODINGS:
         try:
-            with open(filepath, encoding=encoding) as file:
-                file.read()
+            head.decode(encoding)
             return encoding
         except UnicodeDecodeError:
             continue
     raise ValueError(f"Could not determine the encoding of file {filepath}.")
 
 
+def decode_dat(raw, filepath=None):
+    """Decodes .dat file contents with the detected encoding.
+
+    Args:
+        raw (bytes): file contents
+        filepath (str, optional): file name used in the error message
+
+    Returns:
+        tuple (str, str): decoded text, encode type
+    """
+    encoding = detect_encoding(raw, filepath)
+    try:
+        return raw.decode(encoding), encoding
+    except UnicodeDecodeError:
+        pass
+    # The body did not match the header encoding; check the whole file.
+    for encoding in ENCODINGS:
+        try:
+            return raw.decode(encoding), encoding
+        except UnicodeDecodeError:
+            continue
+    raise ValueError(f"Could not determine the encoding of file {filepath}.")
+
+
+# Column layout of the spectrum block (line 4 onward)
+DAT_DTYPE = np.dtype([("uvEnergy", float), ("countingRate", float),
+                      ("flGrandLevel", int), ("flRegLevel", int),
+                      ("uvIntensity", float)])
+
+
+def parse_dat_rows(lines):
+    """Parses the spectrum rows of a .dat file into typed columns in one call.
+
+    Args:
+        lines (list[str]): data lines (line 4 onward)
+
+    Returns:
+        numpy.ndarray: structured array with the fields of DAT_DTYPE
+    """
+    return np.loadtxt(lines, delimiter=",", dtype=DAT_DTYPE,
+                      usecols=range(len(DAT_DTYPE.names)), ndmin=1)
+
+
+def _buffer(buf, n):
+    """First n elements of a reusable buffer, or a new array."""
+    return np.empty(n) if buf is None else buf[:n]
+
+
+def count_calibration_kernel(countingRate, deadTime, bgCountingRate, sensitivity1, out=None, scratch=None):
+    """Counting rate calibration (AC-5, AC-2S) without temporary arrays.
+
+    countingRate/(1-deadTime*countingRate)*exp(0.13571/(1-0.0028*countingRate))*sensitivity1
+    minus the same term for bgCountingRate, which is a scalar and computed once.
+
+    Args:
+        countingRate (numpy.ndarray): Counting rate
+        deadTime (float): Dead time
+        bgCountingRate (float): Background counting rate
+        sensitivity1 (float): Sensitivity correction coefficient 1
+        out (numpy.ndarray, optional): Output buffer (reused across files). Defaults to None.
+        scratch (numpy.ndarray, optional): Work buffer (reused across files). Defaults to None.
+
+    Returns:
+        numpy.ndarray: Calibrated counting rate (a view of out when given)
+    """
+    n = len(countingRate)
+    out = _buffer(out, n)
+    tmp = _buffer(scratch, n)
+
+    bg_term = (bgCountingRate/(1-deadTime*bgCountingRate))*(np.exp(0.13571/(1-0.0028*bgCountingRate))*sensitivity1)
+
+    # exp(0.13571/(1-0.0028*c))*sensitivity1
+    np.multiply(countingRate, -0.0028, out=tmp)
+    tmp += 1
+    np.divide(0.13571, tmp, out=tmp)
+    np.exp(tmp, out=tmp)
+    tmp *= sensitivity1
+    # c/(1-deadTime*c)
+    np.multiply(countingRate, -deadTime, out=out)
+    out += 1
+    np.divide(countingRate, out, out=out)
+
+    out *= tmp
+    out -= bg_term
+    return out
+
+
+def pyield_kernel(countingCorrection, photonCorrection, powerNumber, ydata_out=None, npyield_out=None):
+    """PYS intensity without temporary arrays.
+
+    Args:
+        countingCorrection (numpy.ndarray): Calibrated counting rate
+        photonCorrection (numpy.ndarray): Calibrated photon number
+        powerNumber (float): Power number
+        ydata_out (numpy.ndarray, optional): Output buffer for ydata. Defaults to None.
+        npyield_out (numpy.ndarray, optional): Output buffer for npyield. Defaults to None.
+
+    Returns:
+        tuple (numpy.ndarray, numpy.ndarray): ydata, npyield
+    """
+    n = len(countingCorrection)
+    ydata = _buffer(ydata_out, n)
+    npyield = _buffer(npyield_out, n)
+
+    np.divide(countingCorrection, photonCorrection, out=ydata)
+    # Replace negative values with 0 (NaN is kept, as with np.where)
+    np.copyto(ydata, 0, where=ydata < 0)
+    np.power(ydata, powerNumber, out=npyield)
+    # replace Nan with 0
+    np.copyto(npyield, 0, where=np.isnan(npyield))
+    return ydata, npyield
+
+
+def getEncode(filepath):
+    """Automatically determines the encoding of a file.
+     If the file name contains Japanese, the encoding method may be Shift-jis.
+     Function that returns the encoding method.
+
+    Args:
+        filepath (str): fil path and name
+
+    Returns:
+        encode type(str): encode type
+    """
+    raw = Path(filepath).read_bytes()
+    return decode_dat(raw, filepath)[1]
+
+
 class AcConv():
     """Extraction of measurement metadata data from the AC.dat file.
     
@@ -86,69 +224,180 @@ class AcConv():
         >>> # dict_keys(['thresholdEnergy', 'slope', 'yslice', 'bg'])
  
     """
-    def __init__(self,file_name):
+    # Optional ConvStats that records the time of each conversion stage
+    stats = None
+    # .dat contents given in memory (see from_bytes); None reads file_name
+    _raw = None
+
+    def __init__(self,file_name, stats=None):
         """Constructor.
 
         Args:
             file_name (str): .dat filename
+            stats (ConvStats, optional): Collects stage times and counters. Defaults to None.
         """
         self.file_name = Path(file_name)
+        self.stats = stats
+
+    @classmethod
+    def from_bytes(cls, data, file_name=None, **kwargs):
+        """Builds a converter from .dat contents in memory (e.g. an upload).
+
+        Args:
+            data (bytes or file-like): file contents, or a binary file object with read()
+            file_name (str, optional): name used as file_name (metadata and export names).
+                Defaults to None (the name of the file object, else 'upload.dat').
+            **kwargs: other constructor arguments (stats, limit_energy, ...)
+
+        Returns:
+            AcConv: converter (convert() is not called yet)
+        """
+        if hasattr(data, 'read'):
+            if file_name is None:
+                file_name = getattr(data, 'name', None)
+            data = data.read()
+        acdata = cls(file_name or 'upload.dat', **kwargs)
+        acdata._raw = bytes(data)
+        return acdata
+
+    def _stage(self, name):
+        """Context manager timing a conversion stage (does nothing without stats)."""
+        if self.stats is None:
+            return NULL_STAGE
+        return self.stats.stage(name)
         
     def convert(self):
         """Converts data and generates metadata, DataFrame, JSON, etc.
 
         """
         self._read_para()
-        self.countingCorrection = self._count_calibration()
-        self.photonCorrection = self._photon_calibration()
-        self.ydata, self.npyield = self._pyield_intensity()
-        self.user_estimation()
-        self._make_metadata()
+        with self._stage('calibration'):
+            self.countingCorrection = self._count_calibration()
+            self.photonCorrection = self._photon_calibration()
+            self.ydata, self.npyield = self._pyield_intensity()
+        with self._stage('user_estimation'):
+            self.user_estimation()
+        with self._stage('metadata'):
+            self._make_metadata()
          
+    # Original metadata keys
+    meta_keys = ["fileType","deadTime","countingTime","powerNumber",
+                 "anodeVoltage","step","model","yAxisMaximum","startEnergy",
+                 "finishEnergy","flagDifDataGroundLevel","bgCountingRate","measureDate","sampleName",
+                 "uvIntensity59","targetUv","nameLightCorrection","sensitivity1","sensitivity2"]
+
+    # Keys for calculated data (values are lists)
+    calc_data_keys = ["uvEnergy", "countingCorrection", "photonCorrection", "pyield", "npyield","nayield", "guideline",
+                      "countingRate","flGrandLevel","flRegLevel","uvIntensity"]
+
+    # Reliable data range (see AdvAcConv): light intensity correction above
+    # limit_energy may not be accurate, and countingCorrection above the
+    # ceiling of the model means detector overflow.
+    limit_energy = 6.81
+    limit_count = None
+    count_limits = {'AC-2': 2000, 'AC-3': 2000}
+    default_count_limit = 4000
+
+    def _count_limit(self):
+        """countingCorrection ceiling for this model.
+
+        Returns:
+            float: ceiling
+        """
+        if isinstance(self.limit_count, dict):
+            limits = {**self.count_limits, **self.limit_count}
+        elif self.limit_count is not None:
+            return self.limit_count
+        else:
+            limits = self.count_limits
+        return limits.get(self.model, self.default_count_limit)
+
+    def _trim_conditions(self):
+        """Rules for the reliable data range. The range ends at the first point where
+        any rule is True (AdvAcConv trims the data there).
+
+        Returns:
+            list[numpy.ndarray]: boolean arrays
+        """
+        return [self.uvEnergy >= self.limit_energy,
+                self.countingCorrection >= self._count_limit()]
+
+    # Per-spectrum arrays (one value per energy point). Trimming applies to all of them.
+    spectrum_attrs = ["uvEnergy", "countingCorrection", "photonCorrection", "ydata", "npyield", "nayield", "guideline",
+                      "countingRate", "flGrandLevel", "flRegLevel", "uvIntensity", "nPhoton", "cc_pys", "cc_npys"]
+
     def _make_metadata(self):
-        # Original metadata keys
-        meta_keys = ["fileType","deadTime","countingTime","powerNumber",
-                      "anodeVoltage","step","model","yAxisMaximum","startEnergy",
-                      "finishEnergy","flagDifDataGroundLevel","bgCountingRate","measureDate","sampleName",
-                      "uvIntensity59","targetUv","nameLightCorrection","sensitivity1","sensitivity2"]
-        
+        # metadata, calcdata, json and df are built on first access.
+        self._metadata = None
+        self._calcdata = None
+        self._json = None
+        self._df = None
+
         meta_values = [self.fileType, self.deadTime, self.countingTime, self.powerNumber,
                       self.anodeVoltage, self.step,self.model, self.yAxisMaximum, self.startEnergy,
                       self.finishEnergy,self.flagDifDataGroundLevel, self.bgCountingRate,self.measureDate,self.sampleName,
                       self.uvIntensity59,self.targetUv, self.nameLightCorrection, self.sensitivity1,self.sensitivity2]
         
-        # Keys for calculated data (values are lists)
-        calc_data_keys = ["uvEnergy", "countingCorrection", "photonCorrection", "pyield", "npyield","nayield", "guideline",
-                         "countingRate","flGrandLevel","flRegLevel","uvIntensity"]
-        
-        calc_data_values = [self.uvEnergy, self.countingCorrection, self.photonCorrection, self.ydata, self.npyield, self.nayield, self.guideline,
-                            self.countingRate,self.flGrandLevel,self.flRegLevel,self.uvIntensity]
-        calc_data_values_list = [d.tolist() for d in calc_data_values]
-        
-        # Filename key
-        file_meta ={'file_name':self.file_name.name}
-        
-        self.metadata = dict(zip(meta_keys + calc_data_keys, meta_values + calc_data_values_list)) 
-        self.metadata.update(self.estimate_value)
-        self.metadata.update(file_meta)
-        
-        self.calcdata = dict(zip(calc_data_keys,calc_data_values))
-        
         # Metadata excluding calculated data
         # self.metadata_wo_calc: the calculated data, which is array data, is not included.
-        self.metadata_wo_calc = dict(zip(meta_keys,meta_values)) 
+        self.metadata_wo_calc = dict(zip(self.meta_keys,meta_values)) 
         self.metadata_wo_calc.update(self.estimate_value)
-        self.metadata_wo_calc.update(file_meta)
-        
-        self.json = json.dumps(self.metadata)   
-        self.df = pd.DataFrame(self.calcdata)
+        # Filename key
+        self.metadata_wo_calc.update({'file_name':self.file_name.name})
+
+    @property
+    def calcdata(self):
+        """dict[numpy.ndarray]: calculated data (arrays)"""
+        if self._calcdata is None:
+            calc_data_values = [self.uvEnergy, self.countingCorrection, self.photonCorrection, self.ydata, self.npyield, self.nayield, self.guideline,
+                                self.countingRate,self.flGrandLevel,self.flRegLevel,self.uvIntensity]
+            self._calcdata = dict(zip(self.calc_data_keys,calc_data_values))
+        return self._calcdata
+
+    @property
+    def metadata(self):
+        """dict: metadata including the calculated data as lists"""
+        if self._metadata is None:
+            meta_wo = self.metadata_wo_calc
+            self._metadata = {k: meta_wo[k] for k in self.meta_keys}
+            self._metadata.update({k: d.tolist() for k, d in self.calcdata.items()})
+            self._metadata.update(self.estimate_value)
+            self._metadata.update({'file_name':meta_wo['file_name']})
+        return self._metadata
+
+    @property
+    def json(self):
+        """str: metadata in JSON format"""
+        if self._json is None:
+            # straight from the arrays, metadata (lists) is not built
+            self._json = datjson.dumps(datjson.record(self))
+        return self._json
+
+    @property
+    def df(self):
+        """pandas.DataFrame: calculated data"""
+        if self._df is None:
+            import pandas as pd
+            self._df = pd.DataFrame(self.calcdata)
+        return self._df
         
     def _read_para(self):
+        # read the file once and parse it from memory
+        with self._stage('read'):
+            raw = self._raw if self._raw is not None else self.file_name.read_bytes()
+        with self._stage('encoding'):
+            text, self.encoding = decode_dat(raw, str(self.file_name))
+        with self._stage('parse'):
+            self._parse_text(text)
+        if self.stats is not None:
+            self.stats.count('files')
+            self.stats.count('bytes_read', len(raw))
+            self.stats.count('points', len(self.uvEnergy))
+
+    def _parse_text(self, text):
+        lines = text.splitlines()
         # read parameters up to the third line
-        enc = getEncode(str(self.file_name))
-        with open(str(self.file_name),encoding=enc) as f:
-            reader = csv.reader(f)
-            meta = [row for row in reader]
+        meta = [row for row in csv.reader(lines[:HEADER_LINES])]
 
         # Match the parameter list to the full parameter list.
         # this case is AC-5 old dat type
@@ -179,20 +428,24 @@ class AcConv():
         self.sensitivity1 = float(meta[2][3])
         self.sensitivity2 = float(meta[2][4])
         
-        # Transpose row to col
-        raw_data = [list(x) for x in zip(*meta[3:])]
-        self.uvEnergy = np.array([float(v) for v in raw_data[0]])
-        self.countingRate = np.array([float(v) for v in raw_data[1]])
-        self.flGrandLevel = np.array([int(v) for v in raw_data[2]])
-        self.flRegLevel = np.array([int(v) for v in raw_data[3]])
-        self.uvIntensity = np.array([float(v) for v in raw_data[4]])
+        # Spectrum block: one bulk conversion to typed columns
+        raw_data = parse_dat_rows(lines[HEADER_LINES:])
+        self.uvEnergy = np.ascontiguousarray(raw_data["uvEnergy"])
+        self.countingRate = np.ascontiguousarray(raw_data["countingRate"])
+        self.flGrandLevel = np.ascontiguousarray(raw_data["flGrandLevel"])
+        self.flRegLevel = np.ascontiguousarray(raw_data["flRegLevel"])
+        self.uvIntensity = np.ascontiguousarray(raw_data["uvIntensity"])
        
        
-    def _count_calibration(self):
+    def _count_calibration(self, out=None, scratch=None):
         """Performs counting rate calibration.
 
         "AC-3" and "AC-2" data do not require counting rate calibration.
 
+        Args:
+            out (numpy.ndarray, optional): Output buffer (at least as long as the data). Defaults to None.
+            scratch (numpy.ndarray, optional): Work buffer of the same size. Defaults to None.
+
         Returns:
             numpy.ndarray: Calibrated counting rate
         """
@@ -202,11 +455,8 @@ class AcConv():
             self.countingCorrection = self.countingRate
             
         else:
-            part1 = (self.countingRate)/(1-self.deadTime*(self.countingRate))
-            part2 = np.exp(0.13571/(1-0.0028*(self.countingRate)))*self.sensitivity1
-            part3 = (self.bgCountingRate)/(1-self.deadTime*(self.bgCountingRate))
-            part4 = np.exp(0.13571/(1-0.0028*(self.bgCountingRate)))*self.sensitivity1
-            self.countingCorrection = part1*part2-part3*part4
+            self.countingCorrection = count_calibration_kernel(self.countingRate, self.deadTime, self.bgCountingRate,
+                                                               self.sensitivity1, out=out, scratch=scratch)
           
         return self.countingCorrection
 
@@ -224,20 +474,18 @@ class AcConv():
 
         return self.photonCorrection
 
-    def _pyield_intensity(self):
+    def _pyield_intensity(self, ydata_out=None, npyield_out=None):
         """Calculates PYS intensity.
 
+        Args:
+            ydata_out (numpy.ndarray, optional): Output buffer for ydata. Defaults to None.
+            npyield_out (numpy.ndarray, optional): Output buffer for npyield. Defaults to None.
+
         Returns:
             tuple (numpy.ndarray, numpy.ndarray): ydata, npyield
         """
-        self.ydata = self.countingCorrection/self.photonCorrection
-        # Replace negative values with 0
-        self.ydata = np.where(self.ydata < 0, 0, self.ydata)
-        self.npyield = np.power(self.ydata, self.powerNumber)
-        
-        # replace Nan with 0
-        self.npyield[np.isnan(self.npyield)] = 0
-
+        self.ydata, self.npyield = pyield_kernel(self.countingCorrection, self.photonCorrection, self.powerNumber,
+                                                 ydata_out=ydata_out, npyield_out=npyield_out)
         return self.ydata, self.npyield
     
     
@@ -335,6 +583,27 @@ class AcConv():
             self.guideline = np.array([np.nan]*len(self.uvEnergy.tolist()))
 
       
+    def auto_estimation(self, refine=False):
+        """ Estimates the threshold value automatically, without the user flags.
+        The ReLU model (background + linear onset) is fitted by scanning all breakpoints
+        (see datfit.auto_threshold_batch). Points from the first one above limit_energy
+        or the counting ceiling of the model on are not used.
+
+        Args:
+            refine (bool, optional): Refine the result with scipy curve_fit. Defaults to False.
+
+        Returns:
+            dict[float]: 'thresholdEnergy', 'slope','yslice','bg'
+        """
+        # only the reliable points before the first one above the limits
+        cut = np.logical_or.reduce(self._trim_conditions())
+        mask = ~np.logical_or.accumulate(cut)
+        self.auto_estimate_value = auto_threshold_batch(self.uvEnergy, self.npyield, mask, refine=refine)
+        self.auto_guideline = AcConv.relu(xdata=self.uvEnergy, a=self.auto_estimate_value['slope'],
+                                          b=self.auto_estimate_value['yslice'],
+                                          bg=self.auto_estimate_value['bg'])
+        return self.auto_estimate_value
+
     def export_df2csv(self,df_out_file_name=None):
         """Exports the DataFrame data to a CSV file.
 
@@ -346,18 +615,17 @@ class AcConv():
         
         self.df.to_csv(df_out_file_name, index=False)
     
-    def export_json(self,json_out_file_name=None):
+    def export_json(self,json_out_file_name=None, pretty=True):
         """Exports the metadata to a JSON file.
 
         Args:
             json_out_file_name (str, optional): Output filename. Defaults to None.
+            pretty (bool, optional): Indented output. Defaults to True.
         """
         if json_out_file_name is None:
             json_out_file_name =self.file_name.with_suffix('.json')
 
-        dict_json = json.loads(self.json)
-        with open(json_out_file_name, 'w') as f:
-            json.dump(dict_json, f, indent=4)
+        datjson.dump(datjson.record(self), json_out_file_name, pretty=pretty)
     
     def plot_ax(self, axi=None):
         """Plots the data.
@@ -369,6 +637,7 @@ class AcConv():
         Returns:
             matplotlib.axes._subplots.AxesSubplot: The plotted axis.
         """
+        import matplotlib.pyplot as plt
 
         if axi is None:
             fig_ = plt.figure()
@@ -376,7 +645,7 @@ class AcConv():
         else:
             ax_ = axi
   
-        ax_.set_title(f'{self.metadata["sampleName"]}')   
+        ax_.set_title(f'{self.metadata_wo_calc["sampleName"]}')   
         ax_.plot(self.uvEnergy, self.npyield,'ro',label='Data')
 
         if  ~np.isnan(self.estimate_value['thresholdEnergy']):
@@ -386,13 +655,13 @@ class AcConv():
             ax_.text(self.estimate_value["thresholdEnergy"], np.max(self.npyield)*0.3, f'{self.estimate_value["thresholdEnergy"]:.2f}')
 
             ax_.set_xlabel('Energy [eV]')
-            ax_.legend(title=f"Power {self.metadata['uvIntensity59']:.2f}nW")
+            ax_.legend(title=f"Power {self.metadata_wo_calc['uvIntensity59']:.2f}nW")
             ax_.grid()
             
-            if 0.49 < self.metadata["powerNumber"] < 0.51:
+            if 0.49 < self.metadata_wo_calc["powerNumber"] < 0.51:
                 ax_.set_ylabel('Photoelectron yield$^{1/2}$ [arb.unit]')
         
-            elif 0.3 < self.metadata["powerNumber"] < 0.35 :
+            elif 0.3 < self.metadata_wo_calc["powerNumber"] < 0.35 :
                 ax_.set_ylabel('Photoelectron yield$^{1/3}$ [arb.unit]')
             else:
                 pass
@@ -415,67 +684,42 @@ class AdvAcConv(AcConv):
     Calculated value after counting error correction: countingCorrection
     AC-2, AC-3 Max :2000cps
     AC-5, AC-2S Max :4000cps
+
+    Args:
+        file_name (str): .dat filename
+        limit_energy (float, optional): Data at or above this energy are removed. Defaults to 6.81.
+        limit_count (float or dict, optional): countingCorrection ceiling, or a dict of
+            model -> ceiling that overrides count_limits. Defaults to None (count_limits).
+        stats (ConvStats, optional): Collects stage times and counters. Defaults to None.
     
     """
-    def __init__(self, file_name):
-        super().__init__(file_name)
+    def __init__(self, file_name, limit_energy=6.81, limit_count=None, stats=None):
+        super().__init__(file_name, stats=stats)
+        self.limit_energy = limit_energy
+        self.limit_count = limit_count
     
     def convert(self):
         self._read_para()
-        self.countingCorrection = self._count_calibration()
-        self.photonCorrection = self._photon_calibration()
-        self.ydata, self.npyield = self._pyield_intensity()
-        self.user_estimation()
-        self._trim_array_energy()
-        self._trim_array_maxcount()
-        self._make_metadata()
-    
-    def _trim_array_energy(self):
-        """trim array data by max energy at 6.8.
+        with self._stage('calibration'):
+            self.countingCorrection = self._count_calibration()
+            self.photonCorrection = self._photon_calibration()
+            self.ydata, self.npyield = self._pyield_intensity()
+        with self._stage('user_estimation'):
+            self.user_estimation()
+        with self._stage('trimming'):
+            self._trim_arrays()
+        with self._stage('metadata'):
+            self._make_metadata()
+
+    def _trim_arrays(self):
+        """trim all spectrum arrays at the first point that breaks a trim rule.
         """
-        limit_x_value = 6.81
-        trim_max_index = np.argmax(self.uvEnergy >= limit_x_value)
-        # If there are no values greater than limit_x_value,
-        # trim_max_index will be 0. To avoid this,
-        # if no values satisfy the condition, use the maximum index of the data.
-        if np.all(self.uvEnergy < limit_x_value):
-            trim_max_index = len(self.uvEnergy) + 1      
-        self.uvEnergy = self.uvEnergy[:trim_max_index]
-        self.countingCorrection = self.countingCorrection[:trim_max_index]
-        self.countingRate = self.countingRate[:trim_max_index]
-        self.photonCorrection = self.photonCorrection[:trim_max_index] 
-        self.flGrandLevel = self.flGrandLevel[:trim_max_index]
-        self.flRegLevel = self.flRegLevel[:trim_max_index]
-        self.uvIntensity = self.uvIntensity[:trim_max_index] 
-        self.ydata = self.ydata[:trim_max_index]
-        self.npyield = self.npyield[:trim_max_index]
-        self.nayield = self.nayield[:trim_max_index]
-        self.guideline = self.guideline[:trim_max_index]
-    
-    def _trim_array_maxcount(self):
-        """trim array data by max countingCorrection
-        """
-        if self.model == 'AC-3' or self.model == 'AC-2':
-            limit_countingCorrection = 2000 
-        else:
-            limit_countingCorrection = 4000
-            
-        trim_first_index = np.argmax(self.countingCorrection >= limit_countingCorrection)
-
-        if np.all(self.countingCorrection < limit_countingCorrection):
-            trim_first_index = len(self.countingCorrection) + 1
-        
-        self.uvEnergy = self.uvEnergy[:trim_first_index]
-        self.countingCorrection = self.countingCorrection[:trim_first_index]
-        self.countingRate = self.countingRate[:trim_first_index]
-        self.photonCorrection = self.photonCorrection[:trim_first_index]   
-        self.flGrandLevel = self.flGrandLevel[:trim_first_index]
-        self.flRegLevel = self.flRegLevel[:trim_first_index]
-        self.uvIntensity = self.uvIntensity[:trim_first_index]
-        self.ydata = self.ydata[:trim_first_index] 
-        self.npyield = self.npyield[:trim_first_index]
-        self.nayield = self.nayield[:trim_first_index]
-        self.guideline = self.guideline[:trim_first_index]
+        cut = np.logical_or.reduce(self._trim_conditions())
+        self.trim_index = int(np.argmax(cut)) if cut.any() else len(cut)
+        for name in self.spectrum_attrs:
+            if hasattr(self, name):
+                # slices are views, no copy
+                setattr(self, name, getattr(self, name)[:self.trim_index])
             
      
 if __name__ =='__main__':
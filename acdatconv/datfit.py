@@ -0,0 +1,209 @@
+"""
+Vectorized threshold fitting
+
+Closed-form versions of AcConv.user_fit that fit many spectra (rows of 2D
+arrays) at once. Only NumPy is used.
+
+"""
+import numpy as np
+
+
+def masked_nanmean(ydata, mask):
+    """Row-wise mean of the masked, non-NaN values (NaN for empty rows).
+
+    Args:
+        ydata (numpy.ndarray): 2D data
+        mask (numpy.ndarray): 2D bool, points to use
+
+    Returns:
+        numpy.ndarray: 1D mean per row
+    """
+    use = mask & ~np.isnan(ydata)
+    count = use.sum(axis=1)
+    total = np.where(use, ydata, 0.0).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return total / count
+
+
+def linear_fit_batch(xdata, ydata, mask):
+    """Row-wise least squares line y = a*x + b over the masked points.
+
+    Same result as np.polyfit(x, y, 1) per row. Rows with fewer than two
+    points give NaN.
+
+    Args:
+        xdata (numpy.ndarray): 2D x
+        ydata (numpy.ndarray): 2D y
+        mask (numpy.ndarray): 2D bool, points to use
+
+    Returns:
+        tuple (numpy.ndarray, numpy.ndarray): slope a, y-intercept b
+    """
+    n = mask.sum(axis=1)
+    x = np.where(mask, xdata, 0.0)
+    y = np.where(mask, ydata, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        xm = x.sum(axis=1) / n
+        ym = y.sum(axis=1) / n
+        # centered sums (two pass) for accuracy
+        dx = np.where(mask, xdata - xm[:, None], 0.0)
+        dy = np.where(mask, ydata - ym[:, None], 0.0)
+        a = (dx * dy).sum(axis=1) / (dx * dx).sum(axis=1)
+        b = ym - a * xm
+    a[n < 2] = np.nan
+    b[n < 2] = np.nan
+    return a, b
+
+
+def fit_threshold_batch(reg_xdata, reg_ydata, reg_mask, bg_ydata, bg_mask):
+    """Batch version of AcConv.user_fit.
+
+    Args:
+        reg_xdata (numpy.ndarray): 2D x (energy)
+        reg_ydata (numpy.ndarray): 2D y used for the regression line
+        reg_mask (numpy.ndarray): 2D bool, regression points
+        bg_ydata (numpy.ndarray): 2D y used for the background
+        bg_mask (numpy.ndarray): 2D bool, background points
+
+    Returns:
+        dict[numpy.ndarray]: 'thresholdEnergy', 'slope', 'yslice', 'bg' (one value per row)
+    """
+    bg = masked_nanmean(bg_ydata, bg_mask)
+    a, b = linear_fit_batch(reg_xdata, reg_ydata, reg_mask)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cross_point = (bg - b) / a
+    return {'thresholdEnergy': cross_point, 'slope': a, 'yslice': b, 'bg': bg}
+
+
+def _take(arr, idx):
+    """arr[i, idx[i]] for each row."""
+    return np.take_along_axis(arr, idx[:, None], axis=1)[:, 0]
+
+
+def auto_threshold_batch(xdata, ydata, mask=None, min_bg=3, min_reg=3, refine=False):
+    """Automatic threshold estimation without user flags (AcConv.relu model).
+
+    The ReLU model y = bg + a*max(x - ip, 0) is fitted exactly by least squares.
+    With ip on a data point the model is linear in (bg, a); with ip inside the
+    segment [x_k, x_k+1] it is the background mean of the points up to k and a
+    free line through the points after k, valid when the two cross inside the
+    segment. The sums needed for every candidate come from cumulative sums, so
+    each spectrum costs O(n) and all rows are processed together. The candidate
+    with the smallest squared error (and a positive slope) is the threshold.
+
+    Args:
+        xdata (numpy.ndarray): energy, 1D or 2D (one spectrum per row, increasing)
+        ydata (numpy.ndarray): yield (e.g. npyield), same shape as xdata
+        mask (numpy.ndarray, optional): valid points, placed before the padding
+            of each row. Defaults to None (finite points).
+        min_bg (int, optional): minimum number of points before the break point. Defaults to 3.
+        min_reg (int, optional): minimum number of points after the break point. Defaults to 3.
+        refine (bool, optional): Refine each result with scipy.optimize.curve_fit
+            on AcConv.relu (e.g. to use its convergence checks).
+            Defaults to False.
+
+    Returns:
+        dict[numpy.ndarray]: 'thresholdEnergy', 'slope', 'yslice', 'bg' (one value per row,
+            NaN where no fit was possible; scalars for 1D input)
+    """
+    one_row = np.ndim(xdata) == 1
+    x = np.atleast_2d(np.asarray(xdata, dtype=float))
+    y = np.atleast_2d(np.asarray(ydata, dtype=float))
+    if mask is None:
+        mask = np.isfinite(x) & np.isfinite(y)
+    else:
+        mask = np.atleast_2d(mask)
+    rows, width = x.shape
+    n = mask.sum(axis=1)
+
+    # center x per row to keep the sums well conditioned
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x_mean = np.where(mask, x, 0.0).sum(axis=1) / n
+    xc = np.where(mask, x - x_mean[:, None], 0.0)
+    yv = np.where(mask, y, 0.0)
+
+    def suffix(values):
+        # out[:, k] = sum of values[:, k:]
+        return np.cumsum(values[:, ::-1], axis=1)[:, ::-1]
+
+    # break point at point k: u = x - x_k for points k.., 0 before
+    m = n[:, None] - np.arange(width)[None, :]
+    s_x, s_y = suffix(xc), suffix(yv)
+    s_xx, s_xy = suffix(xc * xc), suffix(xc * yv)
+    t = xc
+    sum_u = s_x - m * t
+    sum_uu = s_xx - 2 * t * s_x + m * t * t
+    sum_uy = s_xy - t * s_y
+    sum_y = yv.sum(axis=1)[:, None]
+    sum_yy = (yv * yv).sum(axis=1)[:, None]
+    nn = n[:, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        c_uu = sum_uu - sum_u * sum_u / nn
+        c_uy = sum_uy - sum_u * sum_y / nn
+        c_yy = sum_yy - sum_y * sum_y / nn
+        a_k = c_uy / c_uu
+        bg_k = (sum_y - a_k * sum_u) / nn
+        sse = c_yy - c_uy * a_k
+
+    k = np.arange(width)[None, :]
+    ok = (k >= min_bg - 1) & (m - 1 >= min_reg) & (a_k > 0) & np.isfinite(sse)
+
+    # break point between points k and k+1: background mean of points ..k and
+    # an independent line c + a*x through points k+1.., crossing inside [x_k, x_k+1]
+    def shift(values):
+        # out[:, k] = values[:, k+1] (0 past the end)
+        return np.concatenate([values[:, 1:], np.zeros((rows, 1))], axis=1)
+
+    r = m - 1
+    r_x, r_y, r_xx, r_xy = shift(s_x), shift(s_y), shift(s_xx), shift(s_xy)
+    r_yy = shift(suffix(yv * yv))
+    l_n = k + 1
+    l_y = sum_y - r_y
+    l_yy = sum_yy - r_yy
+    t_next = shift(t)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        bg_s = l_y / l_n
+        d_xx = r_xx - r_x * r_x / r
+        d_xy = r_xy - r_x * r_y / r
+        a_s = d_xy / d_xx
+        c_s = (r_y - a_s * r_x) / r
+        ip_s = (bg_s - c_s) / a_s
+        sse_s = (l_yy - l_y * bg_s) + (r_yy - r_y * r_y / r - a_s * d_xy)
+    ok_s = ((l_n >= min_bg) & (r >= min_reg) & (a_s > 0) & np.isfinite(sse_s)
+            & (ip_s > t) & (ip_s < t_next))
+
+    # best of the break points on data points and inside the segments
+    sse_all = np.concatenate([np.where(ok, sse, np.inf), np.where(ok_s, sse_s, np.inf)], axis=1)
+    best = np.argmin(sse_all, axis=1)
+    found = ok.any(axis=1) | ok_s.any(axis=1)
+
+    a = _take(np.concatenate([a_k, a_s], axis=1), best)
+    bg = _take(np.concatenate([bg_k, bg_s], axis=1), best)
+    cross_point = _take(np.concatenate([t, ip_s], axis=1), best) + x_mean
+    b = bg - a * cross_point
+    result = {'thresholdEnergy': cross_point, 'slope': a, 'yslice': b, 'bg': bg}
+    for v in result.values():
+        v[~found] = np.nan
+
+    if refine:
+        _refine_relu(x, y, mask, result)
+
+    if one_row:
+        return {key: v[0] for key, v in result.items()}
+    return result
+
+
+def _refine_relu(x, y, mask, result):
+    """Refines auto_threshold_batch results in place with curve_fit on AcConv.relu."""
+    from scipy.optimize import curve_fit
+    from acdatconv.datconv import AcConv
+
+    for i in np.flatnonzero(np.isfinite(result['thresholdEnergy'])):
+        p0 = (result['slope'][i], result['yslice'][i], result['bg'][i])
+        try:
+            popt, _ = curve_fit(AcConv.relu, x[i, mask[i]], y[i, mask[i]], p0=p0)
+        except (RuntimeError, ValueError):
+            continue
+        a, b, bg = popt
+        result['slope'][i], result['yslice'][i], result['bg'][i] = a, b, bg
+        result['thresholdEnergy'][i] = (bg - b) / a
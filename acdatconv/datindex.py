@@ -0,0 +1,275 @@
+"""
+SQLite metadata index
+
+The metadata_wo_calc fields of every .dat file (sampleName, measureDate,
+model, powerNumber, uvIntensity59, thresholdEnergy, ...) are stored in one
+indexed SQLite table, so that files can be found without converting them
+again. update() only converts files that are new or changed (size/mtime,
+then content hash).
+
+Example :
+    >>> with DatIndex('dat_index.sqlite') as index:
+    ...     index.update('./Datas', recursive=True, jobs=4)
+    ...     rows = index.query(model='AC-3', sample='Au%', date_from='2017', date_to='2018',
+    ...                        threshold=(5.0, 5.3))
+    ...     files = index.paths(model='AC-3', threshold=(5.0, 5.3))
+    ...     convs = index.records(model='AC-3')      # converted AcConv objects
+
+"""
+from datetime import datetime
+import hashlib
+from pathlib import Path
+import sqlite3
+
+from acdatconv import datconv as dv
+from acdatconv.datcache import CODE_VERSION
+from acdatconv.datlib import _map_convert
+
+ESTIMATE_KEYS = ["thresholdEnergy", "slope", "yslice", "bg"]
+# metadata_wo_calc fields stored as columns
+META_COLUMNS = dv.AcConv.meta_keys + ESTIMATE_KEYS + ["file_name"]
+TEXT_COLUMNS = ["fileType", "model", "measureDate", "sampleName", "nameLightCorrection", "file_name"]
+INTEGER_COLUMNS = ["flagDifDataGroundLevel"]
+# Indexed columns (measureTime is measureDate in ISO format, sortable)
+INDEXED_COLUMNS = ["sampleName", "model", "measureTime", "thresholdEnergy", "powerNumber", "uvIntensity59", "sha1"]
+
+# rows written per transaction during update()
+COMMIT_EVERY = 500
+
+
+def _column_type(name):
+    if name in TEXT_COLUMNS:
+        return "TEXT"
+    if name in INTEGER_COLUMNS:
+        return "INTEGER"
+    return "REAL"
+
+
+def _iso_time(measure_date):
+    """'2020/01/17 13:14:29' -> '2020-01-17 13:14:29' (None if not a date)."""
+    for fmt in ("%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M", "%Y/%m/%d"):
+        try:
+            return datetime.strptime(measure_date.strip(), fmt).isoformat(sep=" ")
+        except (ValueError, AttributeError):
+            continue
+    return None
+
+
+def _sha1(path):
+    return hashlib.sha1(Path(path).read_bytes()).hexdigest()
+
+
+class DatIndex():
+    """Indexed table of the metadata of many .dat files.
+
+    Args:
+        db_path (str or pathlib): SQLite file (":memory:" for a temporary index)
+        converter (class, optional): AcConv or AdvAcConv used by update(). Defaults to AcConv.
+    """
+    table = "dat_files"
+
+    def __init__(self, db_path, converter=dv.AcConv):
+        self.db_path = db_path
+        self.converter = converter
+        self.conn = sqlite3.connect(str(db_path))
+        self.conn.row_factory = sqlite3.Row
+        self._create()
+
+    def _create(self):
+        columns = ", ".join(f'"{c}" {_column_type(c)}' for c in META_COLUMNS)
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha1 TEXT, "
+            "converter TEXT, code_version TEXT, error TEXT, measureTime TEXT, "
+            f"{columns})")
+        for c in INDEXED_COLUMNS:
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{c} ON {self.table} ("{c}")')
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def _upsert(self, path, sig, sha1, meta_wo, err):
+        values = {"path": path, "size": sig[0], "mtime_ns": sig[1], "sha1": sha1,
+                  "converter": self.converter.__name__, "code_version": CODE_VERSION, "error": err,
+                  "measureTime": None}
+        if meta_wo is not None:
+            values.update({c: meta_wo[c] for c in META_COLUMNS})
+            values["measureTime"] = _iso_time(meta_wo["measureDate"])
+        else:
+            values.update({c: None for c in META_COLUMNS})
+        names = ", ".join(f'"{k}"' for k in values)
+        marks = ", ".join("?" for _ in values)
+        self.conn.execute(f"INSERT OR REPLACE INTO {self.table} ({names}) VALUES ({marks})",
+                          [float(v) if hasattr(v, "dtype") else v for v in values.values()])
+
+    def update(self, data_path, recursive=False, jobs=1, prune=True):
+        """Adds new files and refreshes changed ones.
+
+        Files with the same size and mtime as in the index are skipped. Otherwise
+        the content hash is compared, and only files with new contents (or indexed
+        with another converter or code version) are converted.
+
+        Args:
+            data_path (str or pathlib): data folder
+            recursive (bool, optional): Also index sub folders. Defaults to False.
+            jobs (int, optional): Worker processes for the conversion, None uses all CPUs. Defaults to 1.
+            prune (bool, optional): Remove rows of files under data_path that no longer exist.
+                Defaults to True.
+
+        Returns:
+            dict[int]: 'added', 'updated', 'unchanged', 'removed', 'errors'
+        """
+        # rows are keyed by the resolved path, whatever spelling the caller uses
+        data_path = Path(data_path).resolve()
+        files = sorted(data_path.rglob('*.dat') if recursive else data_path.glob('*.dat'))
+        # rows of this folder (and its sub folders when recursive)
+        rows = {}
+        for r in self.conn.execute(f"SELECT path, size, mtime_ns, sha1, converter, code_version FROM {self.table}"):
+            parent = Path(r["path"]).parent
+            if parent == data_path or (recursive and data_path in parent.parents):
+                rows[r["path"]] = r
+        counts = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0, "errors": 0}
+
+        todo = {}
+        for fl in files:
+            path = str(fl)
+            st = fl.stat()
+            sig = (st.st_size, st.st_mtime_ns)
+            row = rows.get(path)
+            current = row is not None and row["converter"] == self.converter.__name__ \
+                and row["code_version"] == CODE_VERSION
+            if current and (row["size"], row["mtime_ns"]) == sig:
+                counts["unchanged"] += 1
+                continue
+            sha1 = _sha1(fl)
+            if current and row["sha1"] == sha1:
+                # touched or copied back: same contents
+                self.conn.execute(f"UPDATE {self.table} SET size = ?, mtime_ns = ? WHERE path = ?",
+                                  (sig[0], sig[1], path))
+                counts["unchanged"] += 1
+                continue
+            todo[fl] = (sig, sha1, row is not None)
+
+        n = 0
+        for fl, _, meta_wo, err, _, _ in _map_convert(list(todo), self.converter, jobs, with_spectrum=False):
+            sig, sha1, known = todo[fl]
+            self._upsert(str(fl), sig, sha1, meta_wo, err)
+            counts["errors" if err is not None else ("updated" if known else "added")] += 1
+            n += 1
+            if n % COMMIT_EVERY == 0:
+                self.conn.commit()
+
+        if prune:
+            existing = {str(fl) for fl in files}
+            gone = [(p,) for p in rows if p not in existing]
+            self.conn.executemany(f"DELETE FROM {self.table} WHERE path = ?", gone)
+            counts["removed"] = len(gone)
+        self.conn.commit()
+        return counts
+
+    def _where(self, sample=None, model=None, date_from=None, date_to=None, threshold=None,
+               power=None, where=None, params=()):
+        clauses = ["error IS NULL"]
+        args = []
+        if sample is not None:
+            clauses.append("sampleName LIKE ?")
+            args.append(sample)
+        if model is not None:
+            models = [model] if isinstance(model, str) else list(model)
+            clauses.append(f"model IN ({', '.join('?' for _ in models)})")
+            args += models
+        if date_from is not None:
+            clauses.append("measureTime >= ?")
+            args.append(str(date_from).replace("/", "-"))
+        if date_to is not None:
+            clauses.append("measureTime < ?")
+            args.append(str(date_to).replace("/", "-"))
+        for name, value in (("thresholdEnergy", threshold), ("powerNumber", power)):
+            if value is None:
+                continue
+            if isinstance(value, (tuple, list)):
+                low, high = value
+                if low is not None:
+                    clauses.append(f"{name} >= ?")
+                    args.append(low)
+                if high is not None:
+                    clauses.append(f"{name} <= ?")
+                    args.append(high)
+            else:
+                clauses.append(f"{name} = ?")
+                args.append(value)
+        if where is not None:
+            clauses.append(f"({where})")
+            args += list(params)
+        return " AND ".join(clauses), args
+
+    def query(self, sample=None, model=None, date_from=None, date_to=None, threshold=None, power=None,
+              where=None, params=(), order_by="measureTime"):
+        """Metadata rows of the matching files.
+
+        Args:
+            sample (str, optional): sampleName, SQL LIKE pattern ('Au', 'Au%'). Defaults to None.
+            model (str or list, optional): model name(s). Defaults to None.
+            date_from (str, optional): measured at or after ('2017', '2017-06', '2017/06/20'). Defaults to None.
+            date_to (str, optional): measured before (same formats). Defaults to None.
+            threshold (float or tuple, optional): thresholdEnergy, or (min, max) inclusive. Defaults to None.
+            power (float or tuple, optional): powerNumber, or (min, max). Defaults to None.
+            where (str, optional): extra SQL condition with ? placeholders. Defaults to None.
+            params (tuple, optional): values of the where placeholders. Defaults to ().
+            order_by (str, optional): column to sort by. Defaults to "measureTime".
+
+        Returns:
+            list[dict]: one dict per file (path, metadata_wo_calc fields, measureTime, ...)
+        """
+        cond, args = self._where(sample, model, date_from, date_to, threshold, power, where, params)
+        sql = f"SELECT * FROM {self.table} WHERE {cond}"
+        if order_by:
+            sql += f' ORDER BY "{order_by}", path'
+        return [dict(r) for r in self.conn.execute(sql, args)]
+
+    def paths(self, **conditions):
+        """Paths of the matching files (same conditions as query()).
+
+        Returns:
+            list[pathlib.Path]
+        """
+        return [Path(r["path"]) for r in self.query(**conditions)]
+
+    def errors(self):
+        """Files that could not be converted.
+
+        Returns:
+            dict[str]: path -> error message
+        """
+        return {r["path"]: r["error"] for r in
+                self.conn.execute(f"SELECT path, error FROM {self.table} WHERE error IS NOT NULL")}
+
+    def records(self, cache=None, **conditions):
+        """Converted objects of the matching files (same conditions as query()).
+
+        Args:
+            cache (ConvCache, optional): Read unchanged files from a conversion cache. Defaults to None.
+
+        Returns:
+            list[AcConv]: converted objects of self.converter
+        """
+        convs = []
+        for fl in self.paths(**conditions):
+            acdata = cache.load(fl, self.converter) if cache is not None else None
+            if acdata is None:
+                acdata = self.converter(fl)
+                acdata.convert()
+                if cache is not None:
+                    cache.save(acdata)
+            convs.append(acdata)
+        return convs
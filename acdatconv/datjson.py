@@ -0,0 +1,182 @@
+"""
+JSON serialization of conversion results
+
+Records are serialized straight from the NumPy arrays of AcConv (no
+intermediate metadata lists). The default output is the text of the
+standard json module (NaN written as NaN, as in AcConv.json and the exported
+files); pretty output is the text of json.dump(..., indent=4), built from
+compact pieces.
+
+Strict output (strict=True, used for NDJSON) is valid JSON with the same
+rules for both backends: NaN and Infinity are written as null, no spaces
+between items. orjson is used when it is installed and ensure_ascii is
+False, otherwise the standard json module. The parsed values are the same;
+only the spelling of some exponents differs (1e-05 / 0.00001).
+
+Example :
+    >>> from acdatconv.datjson import dumps, dump, write_ndjson
+    >>> text = dumps(record(acdata))                 # compact
+    >>> line = dumps(record(acdata), strict=True)    # valid JSON, NaN -> null
+    >>> dump(record(acdata), 'data.json')            # pretty
+    >>> write_ndjson(acdata_list, 'all.ndjson')      # one record per line
+
+"""
+from datetime import date, datetime
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+INDENT = 4
+
+
+def json_default(obj):
+    """Converts the NumPy and datetime values that JSON does not know.
+
+    Args:
+        obj: value to convert
+
+    Returns:
+        JSON serializable value
+    """
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+
+def record(acdata, spectrum=True):
+    """Metadata of a converted AcConv with the calculated data as arrays.
+
+    Same keys and order as acdata.metadata (spectrum=True) or
+    acdata.metadata_wo_calc (spectrum=False), without converting the arrays to lists.
+
+    Args:
+        acdata (AcConv): converted data
+        spectrum (bool, optional): Include the calculated data. Defaults to True.
+
+    Returns:
+        dict
+    """
+    meta_wo = acdata.metadata_wo_calc
+    if not spectrum:
+        return meta_wo
+    rec = {k: meta_wo[k] for k in acdata.meta_keys}
+    rec.update(acdata.calcdata)
+    rec.update(acdata.estimate_value)
+    rec['file_name'] = meta_wo['file_name']
+    return rec
+
+
+def _finite(value):
+    """Copy of value with NaN and Infinity replaced by None (arrays without them are kept)."""
+    if isinstance(value, dict):
+        return {k: _finite(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(v) for v in value]
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind in "fc" and not np.isfinite(value).all():
+            return _finite(value.tolist())
+        return value
+    if isinstance(value, (float, np.floating)) and not math.isfinite(value):
+        return None
+    return value
+
+
+def _is_numeric(value):
+    if isinstance(value, np.ndarray):
+        return value.ndim == 1 and value.dtype.kind in "biuf"
+    return isinstance(value, list) and all(type(v) in (int, float) for v in value)
+
+
+def _pretty_flat(obj, indent, default):
+    """Same text as json.dumps(obj, indent=indent) for a dict of scalars and
+    numeric 1D arrays/lists, built from compact (C encoder) pieces."""
+    pad = " " * indent
+    items = []
+    for key, value in obj.items():
+        if _is_numeric(value) and len(value):
+            # numbers never contain ", " so the compact list can be split
+            values = json.dumps(value.tolist() if isinstance(value, np.ndarray) else value)[1:-1].split(", ")
+            text = "[\n" + ",\n".join(pad * 2 + v for v in values) + "\n" + pad + "]"
+        else:
+            text = json.dumps(value, indent=indent, default=default).replace("\n", "\n" + pad)
+        items.append(f"{pad}{json.dumps(key)}: {text}")
+    return "{\n" + ",\n".join(items) + "\n}" if items else "{}"
+
+
+def dumps(obj, pretty=False, ensure_ascii=True, default=json_default, strict=False):
+    """Serializes to a JSON string.
+
+    Args:
+        obj: dict (e.g. record(acdata)) or any JSON serializable value
+        pretty (bool, optional): Indented output (4 spaces). Defaults to False (compact).
+        ensure_ascii (bool, optional): Escape non-ASCII characters. Defaults to True.
+        default (callable, optional): Conversion of unknown types. Defaults to json_default.
+        strict (bool, optional): Valid JSON (NaN and Infinity as null), compact output
+            without spaces. Defaults to False.
+
+    Returns:
+        str
+    """
+    if strict and not pretty:
+        if orjson is not None and not ensure_ascii:
+            option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+            return orjson.dumps(obj, default=default, option=option).decode("utf-8")
+        return json.dumps(_finite(obj), default=default, ensure_ascii=ensure_ascii,
+                          separators=(",", ":"), allow_nan=False)
+    if strict:
+        obj = _finite(obj)
+    if not pretty:
+        return json.dumps(obj, default=default, ensure_ascii=ensure_ascii)
+
+    if isinstance(obj, dict) and ensure_ascii:
+        # the indented encoder of json is pure Python; arrays are the bulk of a record
+        return _pretty_flat(obj, INDENT, default)
+    return json.dumps(obj, indent=INDENT, default=default, ensure_ascii=ensure_ascii)
+
+
+def dump(obj, file_name, pretty=True, default=json_default):
+    """Writes one JSON file.
+
+    Args:
+        obj: dict (e.g. record(acdata))
+        file_name (str or pathlib): output filename
+        pretty (bool, optional): Indented output. Defaults to True.
+        default (callable, optional): Conversion of unknown types. Defaults to json_default.
+    """
+    Path(file_name).write_text(dumps(obj, pretty=pretty, default=default), encoding="utf-8")
+
+
+def write_ndjson(records, out, spectrum=True):
+    """Writes one strict JSON object per line (NaN as null).
+
+    Args:
+        records (iterable): converted AcConv objects or dicts
+        out (str, pathlib or file): output filename or text file
+        spectrum (bool, optional): Include the calculated data of AcConv objects. Defaults to True.
+
+    Returns:
+        int: number of written records
+    """
+    if isinstance(out, (str, Path)):
+        with open(out, "w", encoding="utf-8", newline="") as f:
+            return write_ndjson(records, f, spectrum)
+
+    n = 0
+    for rec in records:
+        if not isinstance(rec, dict):
+            rec = record(rec, spectrum)
+        out.write(dumps(rec, ensure_ascii=False, strict=True) + "\n")
+        n += 1
+    return n
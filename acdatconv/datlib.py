@@ -1,22 +1,101 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 import json
+import os
 from pathlib import Path
 
 import numpy as np
-import matplotlib.pyplot as plt
-import openpyxl
-import pandas as pd
-
-# from pandas.io.json import json_normalize
-from pandas import json_normalize
 
 from acdatconv import datconv as dv
+from acdatconv.datarchive import write_archive
+from acdatconv.datcache import ConvCache, conv_state
+from acdatconv.datplot import plot_pages
+from acdatconv.datstats import ConvStats
+
+def _convert_file(fl, converter=dv.AcConv, keep_state=False, with_stats=False, with_spectrum=True):
+    """Converts one dat file (process pool worker).
 
-def dat_list_make(data_path, figout=True, out_file_name=None):
+    Only the compact metadata dicts are sent back to the parent process.
+
+    Args:
+        fl (pathlib.Path): dat file
+        converter (class, optional): AcConv or AdvAcConv. Defaults to AcConv.
+        keep_state (bool, optional): Also return the converted state for the cache. Defaults to False.
+        with_stats (bool, optional): Also return the stage times (ConvStats.as_dict()). Defaults to False.
+        with_spectrum (bool, optional): Also return the metadata with the spectra as lists.
+            Defaults to True.
+
+    Returns:
+        tuple (dict, dict, str, dict, dict): metadata (None without spectrum), metadata_wo_calc,
+            error message (None if no error), converted state (None if not kept), stats (None if not collected)
+    """
+    stats = ConvStats() if with_stats else None
+    try:
+        acdata = converter(fl, stats=stats)
+        acdata.convert()
+        state = conv_state(acdata) if keep_state else None
+        meta_ = None
+        if with_spectrum:
+            # metadata (with the spectra as lists) is built on first access
+            with acdata._stage('metadata_lists'):
+                meta_ = acdata.metadata
+        return meta_, acdata.metadata_wo_calc, None, state, stats and stats.as_dict()
+    except Exception as e:
+        return None, None, f'{type(e).__name__}: {e}', None, stats and stats.as_dict()
+
+
+def _map_convert(tg_list, converter=dv.AcConv, jobs=1, keep_state=False, with_stats=False, with_spectrum=True):
+    """Converts files in order, optionally with a process pool.
+
+    Args:
+        tg_list (list): dat files
+        converter (class, optional): AcConv or AdvAcConv. Defaults to AcConv.
+        jobs (int, optional): Number of worker processes. 1 runs in this process,
+            None uses all CPUs. Defaults to 1.
+        keep_state (bool, optional): Also return the converted state. Defaults to False.
+        with_stats (bool, optional): Also return the stage times. Defaults to False.
+        with_spectrum (bool, optional): Also return the metadata with the spectra
+            (not sent back from the workers when False). Defaults to True.
+
+    Yields:
+        tuple (pathlib.Path, dict, dict, str, dict, dict): file, metadata, metadata_wo_calc,
+            error message, converted state, stats
+    """
+    if jobs == 1 or len(tg_list) < 2:
+        for fl in tg_list:
+            yield (fl, *_convert_file(fl, converter, keep_state, with_stats, with_spectrum))
+        return
+
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    chunksize = max(1, len(tg_list) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        # executor.map keeps the input order
+        results = executor.map(_convert_file, tg_list, repeat(converter), repeat(keep_state),
+                               repeat(with_stats), repeat(with_spectrum), chunksize=chunksize)
+        for fl, res in zip(tg_list, results):
+            yield (fl, *res)
+
+
+def dat_list_make(data_path, figout=True, out_file_name=None, jobs=1, converter=dv.AcConv,
+                  cache=None, archive=None, stats=None, fig_file=None):
     """Creating a metadata list of data in a folder
     Args:
         data_path (str or pathlib): Data foldar path 
         figout (bool, optional): Figure show. Defaults to True.
         out_file_name (str, optional):Output filename. ex:'test.xlsx'.  Defaults to None.
+        jobs (int, optional): Number of worker processes for the conversion.
+            1 converts in this process, None uses all CPUs. Defaults to 1.
+        converter (class, optional): AcConv or AdvAcConv. Defaults to AcConv.
+        cache (ConvCache or str, optional): Conversion cache or its folder.
+            Unchanged files are read from the cache. Defaults to None.
+        archive (str, optional): Folder for a columnar archive of the spectra
+            (see datarchive.SpectrumArchive). Defaults to None.
+        stats (ConvStats or bool, optional): Collect the time of each conversion stage
+            (also from the worker processes) and print a summary. Defaults to None.
+        fig_file (str, optional): Write all plots as small-multiples pages to this .pdf file
+            or PNG folder (see datplot.plot_pages, headless) instead of showing them.
+            Defaults to None.
 
     output: Excel file containing dat metadata
     
@@ -25,26 +104,56 @@ def dat_list_make(data_path, figout=True, out_file_name=None):
         
     """
     f_path = Path(data_path)
-    tg_list = list(f_path.glob('*.dat'))
+    # sorted so that the row order does not depend on the file system
+    tg_list = sorted(f_path.glob('*.dat'))
     
+    if cache is not None and not isinstance(cache, ConvCache):
+        cache = ConvCache(cache)
+    if stats is True:
+        stats = ConvStats()
+    elif not stats:
+        stats = None
+
+    results = {}
+    if cache is not None:
+        for fl in tg_list:
+            acdata = cache.load(fl, converter)
+            if acdata is not None:
+                results[fl] = (acdata.metadata, acdata.metadata_wo_calc, None)
+        if stats is not None:
+            stats.count('cache_hits', len(results))
+
+    misses = [fl for fl in tg_list if fl not in results]
+    for fl, meta_, meta_wo, err, state, f_stats in _map_convert(misses, converter, jobs, keep_state=cache is not None,
+                                                                with_stats=stats is not None):
+        if state is not None:
+            cache.save_state(fl, converter, state)
+        if f_stats is not None:
+            stats.merge(f_stats)
+        results[fl] = (meta_, meta_wo, err)
+
+    if cache is not None:
+        cache.flush()
+
     meta_list=[]
     meta_wo_list=[]
-    for i,fl in enumerate(tg_list):
+    for fl in tg_list:
+        meta_, meta_wo, err = results[fl]
+        
+        if err is not None:
+            print(f'file error: {fl.name} ({err})')
+            continue
         
-        try:
-            acdata = dv.AcConv(fl)
-            acdata.convert()
-            meta_ = acdata.metadata
-            meta_wo = acdata.metadata_wo_calc
-            plot_data = acdata.calcdata
-            meta_list.append(meta_)
-            meta_wo_list.append(meta_wo)
-       
-        except:
-            print(f'file error: {fl.name}')
+        meta_list.append(meta_)
+        meta_wo_list.append(meta_wo)
         
-        if figout:  
-            make_plot(plot_data,meta_wo)
+        if figout and fig_file is None:
+            # metadata holds uvEnergy, nayield and guideline as lists
+            make_plot(meta_,meta_wo)
+
+    # pandas (and openpyxl through to_excel) is only loaded for the Excel output
+    # from pandas.io.json import json_normalize
+    from pandas import json_normalize
 
     df_meta = json_normalize(meta_list)
     df_meta_wo = json_normalize(meta_wo_list)
@@ -62,9 +171,21 @@ def dat_list_make(data_path, figout=True, out_file_name=None):
     df_meta.to_excel(out_file_name,index=False)
     df_meta_wo.to_excel(out_file_name_wo,index=False)
     
+    if fig_file is not None:
+        print(f'output figures :{fig_file}')
+        plot_pages(meta_list, fig_file, jobs=jobs)
+    
+    if archive is not None:
+        print(f'output archive :{archive}')
+        write_archive(meta_list, archive)
+    
+    if stats is not None:
+        print(stats.summary())
+    
     return df_meta
 
 def make_plot(plotdata,metadata):
+    import matplotlib.pyplot as plt
     
     width_u = 5.2
     height_u = 4
@@ -83,7 +204,7 @@ def make_plot(plotdata,metadata):
     
     # fig.suptitle(title)
     
-    plt.tight_layout()
+    # the figure is created with tight_layout=True
     plt.show()
     
 if __name__ =="__ main__":
@@ -0,0 +1,163 @@
+"""
+Batch plot rendering
+
+Plots of many converted files as small-multiples pages (nrows x ncols panels
+per page), written to a multi-page PDF or to one PNG per page. The Agg canvas
+is used directly (no pyplot, no GUI), so it runs headless. The figure with
+its axes and lines is built once and only the data and labels are replaced
+for each page.
+
+Example :
+    >>> from acdatconv.datplot import plot_pages
+    >>> plot_pages(meta_list, 'report.pdf')                 # multi-page PDF
+    >>> plot_pages(meta_list, './report_png', jobs=4)       # PNG pages, 4 processes
+
+"""
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import os
+from pathlib import Path
+
+import numpy as np
+
+# Values used by a panel (keys of acdata.metadata)
+PLOT_KEYS = ["uvEnergy", "nayield", "guideline", "file_name", "powerNumber", "uvIntensity59",
+             "thresholdEnergy", "slope"]
+
+
+def plot_record(rec):
+    """Values of one panel.
+
+    Args:
+        rec (AcConv or dict): converted object or its metadata (acdata.metadata)
+
+    Returns:
+        dict: PLOT_KEYS -> value (spectra as arrays)
+    """
+    if not isinstance(rec, dict):
+        rec = {**rec.metadata_wo_calc, "uvEnergy": rec.uvEnergy, "nayield": rec.nayield,
+               "guideline": rec.guideline}
+    out = {k: rec[k] for k in PLOT_KEYS}
+    for k in ("uvEnergy", "nayield", "guideline"):
+        out[k] = np.asarray(out[k], dtype=float)
+    return out
+
+
+class PageTemplate():
+    """Figure of nrows x ncols panels that is reused for every page.
+
+    Args:
+        nrows (int, optional): Panels per column. Defaults to 3.
+        ncols (int, optional): Panels per row. Defaults to 3.
+        dpi (int, optional): Resolution of PNG pages. Defaults to 100.
+    """
+    # panel size [inch] (same as datlib.make_plot)
+    width_u = 5.2
+    height_u = 4
+
+    def __init__(self, nrows=3, ncols=3, dpi=100):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        self.fig = Figure(figsize=(ncols*self.width_u, nrows*self.height_u), dpi=dpi)
+        FigureCanvasAgg(self.fig)
+        self.axes = self.fig.subplots(nrows=nrows, ncols=ncols, squeeze=False).ravel()
+        self.lines = []
+        for ax in self.axes:
+            data, = ax.plot([], [], 'ro-', label='Data')
+            guide, = ax.plot([], [], 'b-', label='Guide')
+            ax.set_xlabel('Energy [eV]')
+            ax.grid()
+            self.lines.append((data, guide))
+        self._laid_out = False
+
+    def __len__(self):
+        return len(self.axes)
+
+    def draw(self, records):
+        """Puts up to len(self) records on the page, unused panels are hidden.
+
+        Args:
+            records (list[dict]): plot_record() values
+        """
+        for i, ax in enumerate(self.axes):
+            if i >= len(records):
+                ax.set_visible(False)
+                continue
+            rec = records[i]
+            data, guide = self.lines[i]
+            ax.set_visible(True)
+            data.set_data(rec["uvEnergy"], rec["nayield"])
+            guide.set_data(rec["uvEnergy"], rec["guideline"])
+            ax.set_title(f" {rec['file_name']}")
+            ax.set_ylabel(f"Yield^{rec['powerNumber']:.2f}")
+            ax.legend(title=f"Power: {rec['uvIntensity59']:.2f}nw\nth: {rec['thresholdEnergy']:.2f}eV\n"
+                            f"slop: {rec['slope']:.2f}", loc='upper left')
+            ax.relim()
+            ax.autoscale_view()
+        if not self._laid_out:
+            # the layout of the first page is kept for all pages
+            self.fig.tight_layout()
+            self._laid_out = True
+
+
+def _pages(records, per_page):
+    return [records[i:i + per_page] for i in range(0, len(records), per_page)]
+
+
+def _render_png_pages(pages, out_dir, nrows, ncols, dpi):
+    """Renders (page number, records) pairs to PNG files with one template."""
+    template = PageTemplate(nrows, ncols, dpi)
+    files = []
+    for no, records in pages:
+        template.draw(records)
+        fl = Path(out_dir) / f"page-{no:04d}.png"
+        template.fig.savefig(fl, format="png")
+        files.append(fl)
+    return files
+
+
+def plot_pages(records, out, nrows=3, ncols=3, jobs=1, dpi=100):
+    """Writes the plots of many files as small-multiples pages.
+
+    A PDF is written by one process (one file, one page after the other).
+    PNG pages are split over jobs processes.
+
+    Args:
+        records (list): converted AcConv objects or metadata dicts (acdata.metadata)
+        out (str or pathlib): .pdf file, or folder for page-NNNN.png files
+        nrows (int, optional): Panels per column. Defaults to 3.
+        ncols (int, optional): Panels per row. Defaults to 3.
+        jobs (int, optional): Processes for PNG pages, None uses all CPUs. Defaults to 1.
+        dpi (int, optional): Resolution of PNG pages. Defaults to 100.
+
+    Returns:
+        list[pathlib.Path]: written files
+    """
+    out = Path(out)
+    pages = _pages([plot_record(r) for r in records], nrows*ncols)
+
+    if out.suffix.lower() == ".pdf":
+        from matplotlib.backends.backend_pdf import PdfPages
+
+        template = PageTemplate(nrows, ncols, dpi)
+        with PdfPages(out) as pdf:
+            for page in pages:
+                template.draw(page)
+                pdf.savefig(template.fig)
+        return [out]
+
+    out.mkdir(parents=True, exist_ok=True)
+    numbered = list(enumerate(pages, start=1))
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if jobs == 1 or len(numbered) < 2:
+        return _render_png_pages(numbered, out, nrows, ncols, dpi)
+
+    # one contiguous block of pages (and one template) per process
+    jobs = min(jobs, len(numbered))
+    size = -(-len(numbered) // jobs)
+    blocks = [numbered[i:i + size] for i in range(0, len(numbered), size)]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = executor.map(_render_png_pages, blocks, repeat(out), repeat(nrows), repeat(ncols), repeat(dpi))
+        return [fl for files in results for fl in files]
@@ -0,0 +1,200 @@
+"""
+Compact spectrum record
+
+SpecRecord keeps one converted file with __slots__ (no per-instance dict)
+and one structured array for the whole spectrum. Only the measured columns
+and npyield are stored (nayield only when it differs from npyield); the other
+arrays of AcConv are recalculated by to_acconv(). Metadata lists, JSON and
+DataFrame are not kept.
+
+Example :
+    >>> records = to_records(convs, float32=True)   # list of AcConv
+    >>> rec = records[0]
+    >>> rec.sampleName, rec.thresholdEnergy
+    >>> rec.uvEnergy, rec.npyield                   # views of rec.data
+    >>> acdata = rec.to_acconv()                    # full AcConv again
+
+"""
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from acdatconv import datconv as dv
+
+META_KEYS = tuple(dv.AcConv.meta_keys)
+ESTIMATE_KEYS = ("thresholdEnergy", "slope", "yslice", "bg")
+# Columns of the structured array. nayield is only present when it is not npyield.
+FLOAT_COLUMNS = ("uvEnergy", "countingRate", "uvIntensity", "npyield")
+FLAG_COLUMNS = ("flGrandLevel", "flRegLevel")
+# Settings of AdvAcConv that are kept
+OPTION_KEYS = ("limit_energy", "limit_count")
+
+
+@lru_cache(maxsize=None)
+def spectrum_dtype(float32=False, with_nayield=False):
+    """Structured dtype of a spectrum (shared by all records of the same kind).
+
+    Args:
+        float32 (bool, optional): float32 columns instead of float64. Defaults to False.
+        with_nayield (bool, optional): Add a nayield column. Defaults to False.
+
+    Returns:
+        numpy.dtype
+    """
+    ftype = np.float32 if float32 else np.float64
+    fields = [(name, ftype) for name in FLOAT_COLUMNS]
+    if with_nayield:
+        fields.append(("nayield", ftype))
+    fields += [(name, np.int8) for name in FLAG_COLUMNS]
+    return np.dtype(fields)
+
+
+class SpecRecord():
+    """One converted .dat file in compact form.
+
+    Scalar metadata and estimate values are attributes (rec.sampleName,
+    rec.thresholdEnergy, ...), the stored spectrum columns are views of
+    rec.data (rec.uvEnergy, rec.npyield, ...).
+
+    Args:
+        meta (dict): values of AcConv.meta_keys
+        estimate (dict): 'thresholdEnergy', 'slope', 'yslice', 'bg'
+        file_name (str): file path
+        data (numpy.ndarray): structured array (see spectrum_dtype)
+        converter (class, optional): AcConv or AdvAcConv. Defaults to AcConv.
+        options (dict, optional): AdvAcConv settings (limit_energy, limit_count). Defaults to None.
+    """
+    __slots__ = META_KEYS + ESTIMATE_KEYS + ("file_name", "data", "converter", "options")
+
+    def __init__(self, meta, estimate, file_name, data, converter=dv.AcConv, options=None):
+        for k in META_KEYS:
+            setattr(self, k, meta[k])
+        for k in ESTIMATE_KEYS:
+            setattr(self, k, float(estimate[k]))
+        self.file_name = str(file_name)
+        self.data = data
+        self.converter = converter
+        self.options = options
+
+    @classmethod
+    def from_acconv(cls, acdata, float32=False):
+        """Builds a record from a converted AcConv (or AdvAcConv).
+
+        Args:
+            acdata (AcConv): converted object
+            float32 (bool, optional): Store the spectrum as float32. to_acconv() then
+                recalculates from the rounded values, so results differ slightly.
+                Defaults to False.
+
+        Returns:
+            SpecRecord
+        """
+        with_nayield = not np.array_equal(acdata.nayield, acdata.npyield, equal_nan=True)
+        data = np.empty(len(acdata.uvEnergy), dtype=spectrum_dtype(float32, with_nayield))
+        for name in data.dtype.names:
+            data[name] = getattr(acdata, name)
+        options = None
+        if isinstance(acdata, dv.AdvAcConv):
+            options = {k: getattr(acdata, k) for k in OPTION_KEYS}
+        return cls({k: getattr(acdata, k) for k in META_KEYS}, acdata.estimate_value, acdata.file_name,
+                   data, type(acdata), options)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getattr__(self, name):
+        # only called when the normal lookup fails: stored spectrum columns
+        if name == "nayield":
+            return self.data["nayield"] if "nayield" in self.data.dtype.names else self.data["npyield"]
+        if name in FLOAT_COLUMNS or name in FLAG_COLUMNS:
+            return self.data[name]
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def __getstate__(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
+
+    @property
+    def estimate_value(self):
+        """dict[float]: 'thresholdEnergy', 'slope','yslice','bg'"""
+        return {k: getattr(self, k) for k in ESTIMATE_KEYS}
+
+    @property
+    def metadata_wo_calc(self):
+        """dict: same as AcConv.metadata_wo_calc"""
+        meta = {k: getattr(self, k) for k in META_KEYS}
+        meta.update(self.estimate_value)
+        meta['file_name'] = Path(self.file_name).name
+        return meta
+
+    @property
+    def guideline(self):
+        """numpy.ndarray: fitted line (AcConv.relu), NaN without a fit"""
+        x = self.data["uvEnergy"].astype(float)
+        if np.isnan(self.thresholdEnergy):
+            return np.full(len(x), np.nan)
+        return dv.AcConv.relu(xdata=x, a=self.slope, b=self.yslice, bg=self.bg)
+
+    @property
+    def nbytes(self):
+        """int: bytes of the spectrum array"""
+        return self.data.nbytes
+
+    def to_acconv(self):
+        """Rebuilds the converted object without reading the file.
+
+        The calibrations are recalculated from the stored columns with the
+        AcConv methods; the estimate values are the stored ones (no refit).
+        cc_pys is not restored.
+
+        Returns:
+            AcConv: AcConv or AdvAcConv (metadata, json, df and plot_ax work as after convert())
+        """
+        acdata = self.converter.__new__(self.converter)
+        acdata.file_name = Path(self.file_name)
+        for k in META_KEYS:
+            setattr(acdata, k, getattr(self, k))
+        if self.options:
+            for k, v in self.options.items():
+                setattr(acdata, k, v)
+        for name in FLOAT_COLUMNS[:3]:
+            setattr(acdata, name, self.data[name].astype(float))
+        for name in FLAG_COLUMNS:
+            setattr(acdata, name, self.data[name].astype(int))
+
+        acdata.countingCorrection = acdata._count_calibration()
+        acdata.photonCorrection = acdata._photon_calibration()
+        acdata.ydata, acdata.npyield = acdata._pyield_intensity()
+
+        acdata.bg_flag_ind = np.where(acdata.flGrandLevel == -1)[0].tolist()
+        acdata.reg_flag_ind = np.where(acdata.flRegLevel == -1)[0].tolist()
+        acdata.estimate_value = self.estimate_value
+        if "nayield" in self.data.dtype.names:
+            acdata.nayield = self.data["nayield"].astype(float)
+        else:
+            acdata.nayield = acdata.npyield
+        if not np.isnan(self.thresholdEnergy):
+            # fitted with the user flags (AdvAcConv: before trimming)
+            acdata.cc_npys = acdata.nayield
+        acdata.guideline = self.guideline
+        if self.options:
+            acdata.trim_index = len(self.data)
+        acdata._make_metadata()
+        return acdata
+
+
+def to_records(convs, float32=False):
+    """Compact records of many converted objects.
+
+    Args:
+        convs (iterable): converted AcConv objects
+        float32 (bool, optional): Store the spectra as float32. Defaults to False.
+
+    Returns:
+        list[SpecRecord]
+    """
+    return [SpecRecord.from_acconv(c, float32) for c in convs]
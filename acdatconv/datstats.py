@@ -0,0 +1,116 @@
+"""
+Conversion statistics
+
+Wall time per conversion stage and counters (files, bytes read, points per
+spectrum) collected by AcConv / AdvAcConv / ExcelConv when a ConvStats
+object is given.
+
+"""
+from contextlib import nullcontext
+import json
+from pathlib import Path
+from time import perf_counter
+
+# Used when no stats are collected: entering it costs almost nothing.
+NULL_STAGE = nullcontext()
+
+
+class _Stage():
+    __slots__ = ("stats", "name", "start")
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.add_time(self.name, perf_counter() - self.start)
+
+
+class ConvStats():
+    """Wall time per stage and counters of one or many conversions.
+
+    Example :
+        >>> stats = ConvStats()
+        >>> acdata = AcConv(file_name, stats=stats)
+        >>> acdata.convert()
+        >>> print(stats.summary())
+        >>> stats.export('stats.json')
+    """
+    def __init__(self):
+        self.times = {}
+        self.calls = {}
+        self.counters = {}
+
+    def stage(self, name):
+        """Context manager that adds its wall time to a stage.
+
+        Args:
+            name (str): stage name
+        """
+        return _Stage(self, name)
+
+    def add_time(self, name, seconds):
+        self.times[name] = self.times.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name, value=1):
+        """Adds value to a counter.
+
+        Args:
+            name (str): counter name
+            value (int, optional): Defaults to 1.
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, other):
+        """Adds the values of another ConvStats (or its as_dict()) to this one.
+
+        Args:
+            other (ConvStats or dict): stats to add
+        """
+        if isinstance(other, ConvStats):
+            other = other.as_dict()
+        for name, seconds in other["times"].items():
+            self.times[name] = self.times.get(name, 0.0) + seconds
+        for name, n in other["calls"].items():
+            self.calls[name] = self.calls.get(name, 0) + n
+        for name, value in other["counters"].items():
+            self.count(name, value)
+
+    def as_dict(self):
+        """dict: times, calls and counters (picklable, JSON serializable)"""
+        return {"times": dict(self.times), "calls": dict(self.calls), "counters": dict(self.counters)}
+
+    def summary(self):
+        """Text table of the stage times and counters.
+
+        Returns:
+            str: summary
+        """
+        total = sum(self.times.values())
+        lines = [f"{'stage':<18}{'calls':>8}{'total [s]':>12}{'mean [ms]':>12}{'share':>8}"]
+        for name, seconds in self.times.items():
+            n = self.calls[name]
+            share = seconds / total if total else 0.0
+            lines.append(f"{name:<18}{n:>8}{seconds:>12.4f}{seconds / n * 1000:>12.3f}{share:>8.1%}")
+        lines.append(f"{'total':<18}{'':>8}{total:>12.4f}")
+        for name, value in self.counters.items():
+            lines.append(f"{name}: {value}")
+        files = self.counters.get("files", 0)
+        if files:
+            lines.append(f"points per spectrum: {self.counters.get('points', 0) / files:.1f}")
+            if total:
+                lines.append(f"files/sec: {files / total:.1f}")
+        return "\n".join(lines)
+
+    def export(self, file_name):
+        """Writes the stats as JSON.
+
+        Args:
+            file_name (str): output filename
+        """
+        Path(file_name).write_text(json.dumps(self.as_dict(), indent=4), encoding="utf-8")
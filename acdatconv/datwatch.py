@@ -0,0 +1,240 @@
+"""
+Watch folder conversion
+
+Converts .dat files as the instruments write them into a folder. A file is
+converted once its size and modification time have not changed for `settle`
+seconds (the instrument has finished writing it), and the record is passed
+to a writer that appends to a rolling output (NDJSON or columnar archive,
+see cli.py). Earlier results are never rewritten; a modified file is
+converted again and appended as a new record. The writer is flushed (for an
+archive: one new part) at most every `flush_interval` seconds, and the state
+file is saved with each flush.
+
+File system events come from watchdog (inotify on Linux) when it is
+installed, otherwise the folder is scanned every `interval` seconds.
+
+Example :
+    >>> from acdatconv.cli import NdjsonWriter
+    >>> with open('rolling.ndjson', 'a', encoding='utf-8') as f:
+    ...     watcher = DatWatcher('./incoming', NdjsonWriter(f), state_file='watch_state.json')
+    ...     watcher.run()          # until Ctrl+C or watcher.stop()
+
+"""
+import json
+import os
+from pathlib import Path
+import sys
+import threading
+import time
+
+from acdatconv import datconv as dv
+from acdatconv.datlib import _convert_file
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+
+def _signature(path):
+    """(size, mtime_ns) of a file, None if it does not exist (any more)."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+if Observer is not None:
+    class _EventHandler(FileSystemEventHandler):
+        def __init__(self, watcher):
+            self.watcher = watcher
+
+        def on_any_event(self, event):
+            if event.is_directory:
+                return
+            for path in (event.src_path, getattr(event, "dest_path", None)):
+                if path:
+                    self.watcher.notify(path)
+
+
+class DatWatcher():
+    """Converts new and modified .dat files of a folder.
+
+    Args:
+        folder (str or pathlib): watched folder
+        writer: object with write(metadata, metadata_wo_calc), and optionally
+            flush(), close() and with_spectrum (False: metadata is None)
+            (cli.NdjsonWriter, CsvWriter, ArchiveWriter)
+        converter (class, optional): AcConv or AdvAcConv. Defaults to AcConv.
+        settle (float, optional): Seconds without size/mtime change before a file
+            is converted. Defaults to 2.0.
+        interval (float, optional): Seconds between folder scans (polling) or stability
+            checks (events). Defaults to 1.0.
+        recursive (bool, optional): Also watch sub folders. Defaults to False.
+        state_file (str, optional): JSON file with the signatures of the converted files,
+            so that a restarted watcher does not append them again. Defaults to None.
+        skip_existing (bool, optional): Files present at start (and not in the state)
+            are not converted. Defaults to False.
+        use_events (bool, optional): Use watchdog events when installed. Defaults to True.
+        err (file, optional): Stream for messages. Defaults to sys.stderr.
+        flush_interval (float, optional): Minimum seconds between writer flushes
+            (and state saves); 0 flushes after every round with conversions. Defaults to 0.0.
+    """
+    def __init__(self, folder, writer, converter=dv.AcConv, settle=2.0, interval=1.0, recursive=False,
+                 state_file=None, skip_existing=False, use_events=True, err=sys.stderr, flush_interval=0.0):
+        self.folder = Path(folder)
+        self.writer = writer
+        self.converter = converter
+        self.settle = settle
+        self.interval = interval
+        self.recursive = recursive
+        self.state_file = Path(state_file) if state_file else None
+        self.use_events = use_events and Observer is not None
+        self.err = err
+        self.flush_interval = flush_interval
+
+        # path -> signature of the converted file
+        self.done = {}
+        if self.state_file is not None and self.state_file.exists():
+            self.done = json.loads(self.state_file.read_text(encoding="utf-8"))
+        # path -> (signature, time it was first seen with this signature)
+        self.pending = {}
+        self.converted = 0
+        self.errors = 0
+        # converted since the last flush, and the time of that flush
+        self.unflushed = False
+        self._last_flush = time.monotonic()
+
+        self._events = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+        if skip_existing:
+            for fl in self.scan():
+                self.done.setdefault(str(fl), _signature(fl))
+
+    def scan(self):
+        """.dat files in the folder.
+
+        Returns:
+            list[pathlib.Path]: files (sorted)
+        """
+        return sorted(self.folder.rglob('*.dat') if self.recursive else self.folder.glob('*.dat'))
+
+    def notify(self, path):
+        """Marks a path as changed (called by the event handler)."""
+        if Path(path).suffix != '.dat':
+            return
+        with self._lock:
+            self._events.add(str(path))
+        self._wake.set()
+
+    def _candidates(self, full_scan):
+        with self._lock:
+            paths = self._events
+            self._events = set()
+        if full_scan:
+            paths |= {str(fl) for fl in self.scan()}
+        return paths | set(self.pending)
+
+    def poll(self, full_scan=True, now=None):
+        """Checks the candidates once and converts the files that are ready.
+
+        Args:
+            full_scan (bool, optional): Scan the whole folder (else only the event
+                paths and the pending files). Defaults to True.
+            now (float, optional): Current time (time.monotonic()). Defaults to None.
+
+        Returns:
+            int: number of files converted in this call
+        """
+        now = time.monotonic() if now is None else now
+        ready = []
+        for path in sorted(self._candidates(full_scan)):
+            sig = _signature(path)
+            if sig is None or self.done.get(path) == sig:
+                self.pending.pop(path, None)
+                continue
+            seen = self.pending.get(path)
+            if seen is None or seen[0] != sig:
+                # new or still being written: restart the settle time
+                self.pending[path] = (sig, now)
+            elif now - seen[1] >= self.settle:
+                ready.append((path, sig))
+
+        for path, sig in ready:
+            del self.pending[path]
+            meta_, meta_wo, err, _, _ = _convert_file(Path(path), self.converter,
+                                                      with_spectrum=getattr(self.writer, "with_spectrum", True))
+            self.done[path] = sig
+            if err is not None:
+                print(f'file error: {Path(path).name} ({err})', file=self.err)
+                self.errors += 1
+                continue
+            self.writer.write(meta_, meta_wo)
+            self.converted += 1
+
+        if ready:
+            self.unflushed = True
+        if self.unflushed and now - self._last_flush >= self.flush_interval:
+            self.flush(now)
+        return len(ready)
+
+    def flush(self, now=None):
+        """Flushes the writer and saves the state (only files that were written are marked done)."""
+        if hasattr(self.writer, "flush"):
+            self.writer.flush()
+        self.save_state()
+        self.unflushed = False
+        self._last_flush = time.monotonic() if now is None else now
+
+    def save_state(self):
+        """Writes the signatures of the converted files to state_file."""
+        if self.state_file is None:
+            return
+        tmp = self.state_file.with_name(self.state_file.name + ".tmp")
+        tmp.write_text(json.dumps(self.done), encoding="utf-8")
+        tmp.replace(self.state_file)
+
+    def stop(self):
+        """Ends run() (from another thread or a signal handler)."""
+        self._stop.set()
+        self._wake.set()
+
+    def run(self):
+        """Watches the folder until stop() or KeyboardInterrupt, then closes the writer."""
+        observer = None
+        if self.use_events:
+            observer = Observer()
+            observer.schedule(_EventHandler(self), str(self.folder), recursive=self.recursive)
+            observer.start()
+        mode = "events" if observer is not None else f"polling every {self.interval}s"
+        print(f'watching {self.folder} ({mode})', file=self.err)
+
+        try:
+            # files that are already there
+            self.poll(full_scan=True)
+            while not self._stop.is_set():
+                if observer is not None:
+                    # sleep until an event arrives, wake up only while files are settling
+                    # or converted records wait for the next flush
+                    self._wake.wait(self.interval if self.pending or self.unflushed else None)
+                else:
+                    self._wake.wait(self.interval)
+                self._wake.clear()
+                if self._stop.is_set():
+                    break
+                self.poll(full_scan=observer is None)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            if hasattr(self.writer, "close"):
+                self.writer.close()
+            self.save_state()
+            print(f'converted: {self.converted}, errors: {self.errors}', file=self.err)
@@ -5,11 +5,10 @@ import json
 from pathlib import Path
 
 import numpy as np
-import pandas as pd
-import openpyxl as oxl
-import matplotlib.pyplot as plt
 
 from acdatconv import datconv as dv
+from acdatconv import datjson
+from acdatconv.datstats import NULL_STAGE
 
 
 
@@ -47,86 +46,189 @@ class ExcelConv():
                'thresholdEnergy','slope',"powerNumber","bg", "glDisplay"]
 
     key_data=['Energy[eV]', 'Yield', 'Yield^0.5']
+
+    # (rows, cols) searched for the keys
+    key_area = (49, 19)
     
-    def __init__(self,filename):
+    def __init__(self,filename, stats=None):
         self.filename = filename
         self.file_name = Path(filename)
+        # Optional ConvStats that records the time of each conversion stage
+        self.stats = stats
+        self._wb = None
+        self._sheet_rows = {}
+        self._sheet_index = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def workbook(self):
+        """openpyxl.Workbook: the workbook, opened once (read-only, values only) and shared by all sheets"""
+        if self._wb is None:
+            import openpyxl as oxl
+            self._wb = oxl.load_workbook(self.filename, read_only=True, data_only=True)
+        return self._wb
+
+    def close(self):
+        """Closes the workbook and drops the cached sheet values."""
+        if self._wb is not None:
+            self._wb.close()
+            self._wb = None
+        self._sheet_rows = {}
+        self._sheet_index = {}
+
+    def sheet_rows(self, sheet_name):
+        """Values of a sheet, read once.
+
+        Args:
+            sheet_name (str): sheet name
+
+        Returns:
+            list[tuple]: cell values by row
+        """
+        if sheet_name not in self._sheet_rows:
+            sheet = self.workbook[sheet_name]
+            # the stored size (<dimension>) of some exports is wrong or missing:
+            # read all the rows and columns that are actually there
+            sheet.reset_dimensions()
+            self._sheet_rows[sheet_name] = list(sheet.iter_rows(values_only=True))
+        return self._sheet_rows[sheet_name]
+
+    def sheet_index(self, sheet_name):
+        """Value -> (row, col) index of the key search area (1-based).
+        When a value appears more than once, the last one (row by row) is kept.
+
+        Args:
+            sheet_name (str): sheet name
+
+        Returns:
+            dict: cell value -> (row, col)
+        """
+        if sheet_name not in self._sheet_index:
+            n_rows, n_cols = self.key_area
+            index = {}
+            for i, row in enumerate(self.sheet_rows(sheet_name)[:n_rows], start=1):
+                for j, value in enumerate(row[:n_cols], start=1):
+                    if value is not None:
+                        index[value] = (i, j)
+            self._sheet_index[sheet_name] = index
+        return self._sheet_index[sheet_name]
+
+    def block_columns(self, sheet_name, row, column, n_rows, n_cols):
+        """Values of a rectangular block, by column (1-based start, None outside the sheet).
+
+        Returns:
+            list[list]: n_cols columns of n_rows values
+        """
+        rows = self.sheet_rows(sheet_name)[row-1:row-1+n_rows]
+        pad = [None] * n_cols
+        block = [(list(r[column-1:column-1+n_cols]) + pad)[:n_cols] for r in rows]
+        block.extend([pad] * (n_rows - len(block)))
+        return [list(col) for col in zip(*block)] if block else [[] for _ in range(n_cols)]
         
+    def _stage(self, name):
+        """Context manager timing a conversion stage (does nothing without stats)."""
+        if self.stats is None:
+            return NULL_STAGE
+        return self.stats.stage(name)
+
     def convert(self):
-        self.sheet_name = self.find_sheetname()
-        self.startp_key1 = self.find_keys(self.sheet_name[0], self.keys1[0])
-        self.startp_data = self.find_keys(self.sheet_name[0], self.key_data[0])
-        self.m_meta_dict = self.measure_meta(self.sheet_name[0],self.startp_key1)
-        self.data_dict = self.data_meta(self.sheet_name[0], self.startp_data , self.m_meta_dict)
-        self.join_meta_dict = {**self.m_meta_dict, **self.data_dict}
-        self.json = self.json_out(self.join_meta_dict)
+        try:
+            with self._stage('load_workbook'):
+                self.sheet_name = self.find_sheetname()
+            with self._stage('read_sheet'):
+                self.sheet_rows(self.sheet_name[0])
+            with self._stage('find_keys'):
+                self.startp_key1 = self.find_keys(self.sheet_name[0], self.keys1[0])
+                self.startp_data = self.find_keys(self.sheet_name[0], self.key_data[0])
+            with self._stage('measure_meta'):
+                self.m_meta_dict = self.measure_meta(self.sheet_name[0],self.startp_key1)
+            with self._stage('data_meta'):
+                self.data_dict = self.data_meta(self.sheet_name[0], self.startp_data , self.m_meta_dict)
+            self.join_meta_dict = {**self.m_meta_dict, **self.data_dict}
+            with self._stage('json'):
+                self.json = self.json_out(self.join_meta_dict)
+            if self.stats is not None:
+                self.stats.count('files')
+                self.stats.count('bytes_read', self.file_name.stat().st_size)
+                self.stats.count('points', len(next(iter(self.data_dict.values()), [])))
+        finally:
+            # also on errors: do not leave the read-only file open
+            self.close()
         
     def multi_sheet_convert(self):
-        self.sheet_name = self.find_sheetname()
-        muti_meta_list = []
-        for i, fn in enumerate(self.sheet_name):
-            try:
-                t_startp_key1 = self.find_keys(fn, self.keys1[0])
-                t_startp_data = self.find_keys(fn, self.key_data[0])
-                t_m_meta_dict = self.measure_meta(fn,t_startp_key1)
-                t_data_dict = self.data_meta(fn, t_startp_data , t_m_meta_dict)
-                t_file_name = {'file':str(self.file_name), 'sheet':fn}
-                t_join_meta_dict = {**t_file_name, **t_m_meta_dict, **t_data_dict}
+        """Converts all sheets.
+        The native dicts are kept in self.records (same order as the returned list).
+
+        Returns:
+            list[str]: JSON string per sheet
+        """
+        try:
+            self.sheet_name = self.find_sheetname()
+            muti_meta_list = []
+            self.records = []
+            for i, fn in enumerate(self.sheet_name):
+                try:
+                    t_startp_key1 = self.find_keys(fn, self.keys1[0])
+                    t_startp_data = self.find_keys(fn, self.key_data[0])
+                    t_m_meta_dict = self.measure_meta(fn,t_startp_key1)
+                    t_data_dict = self.data_meta(fn, t_startp_data , t_m_meta_dict)
+                    t_file_name = {'file':str(self.file_name), 'sheet':fn}
+                    t_join_meta_dict = {**t_file_name, **t_m_meta_dict, **t_data_dict}
                 
-                t_json_name = self.file_name.stem + fn + '.json'
-                t_json = self.json_out(t_join_meta_dict, jsonfile_name=t_json_name)
-                muti_meta_list.append(t_json)
-            except:
-                print(f'error sheet: {fn}')
+                    t_json_name = self.file_name.stem + fn + '.json'
+                    t_json = self.json_out(t_join_meta_dict, jsonfile_name=t_json_name)
+                    muti_meta_list.append(t_json)
+                    self.records.append(t_join_meta_dict)
+                except:
+                    print(f'error sheet: {fn}')
         
+        finally:
+            self.close()
         return muti_meta_list
             
     @staticmethod        
     def export_excel(meta_list, out_file_name=None):
-        df_meta =  pd.DataFrame([], columns=json.loads(meta_list[0]).keys())
-        for i ,dt in enumerate(meta_list):
-            temp_df = pd.read_json(dt,orient='index').transpose()
-            df_meta = pd.concat([df_meta, temp_df])
+        """Writes one row per sheet to an Excel file.
+
+        Args:
+            meta_list (list[dict] or list[str]): records (self.records) or
+                JSON strings returned by multi_sheet_convert
+            out_file_name (str, optional): Output filename. Defaults to None.
+
+        Returns:
+            DataFrame
+        """
+        import pandas as pd
+
+        records = [json.loads(dt) if isinstance(dt, str) else dt for dt in meta_list]
+        # one construction instead of concatenating a frame per sheet
+        df_meta = pd.DataFrame.from_records(records)
             
         if out_file_name is None:
             out_file_name = 'data_list.xlsx'
 
-        df_meta.to_excel(out_file_name, encoding="utf-8-sig")
+        df_meta.to_excel(out_file_name)
         
         return df_meta
         
     def find_sheetname(self):
-        wb = oxl.load_workbook(self.filename)
-        st_name_list = wb.sheetnames
+        st_name_list = self.workbook.sheetnames
         return st_name_list         
         
     def find_keys(self, sheet_name, word):
-        wb = oxl.load_workbook(self.filename)
-        sheet = wb[sheet_name]
-        for i in range(1,50):
-            for j in range(1,20):
-                get_value = sheet.cell(row=i, column=j).value
-                
-                if get_value == word:
-                    # print(f'find word: {word}')
-                    # print(f'row:{i},col:{j}')   
-                    row_col =(i,j) 
-                else:
-                    pass
-        wb.close()
+        row_col = self.sheet_index(sheet_name)[word]
         return row_col
     
     def measure_meta(self, sheet_name, start_pos):
         s_row, s_col = start_pos
     
-        wb = oxl.load_workbook(self.filename)
-        sheet = wb[sheet_name]
-        values =[]
-        for i ,key in enumerate(self.keys1):
-            get_value = sheet.cell(row=i+s_row, column=s_col+1).value
-            values.append(get_value)
-        
-        wb.close()
+        values = self.block_columns(sheet_name, s_row, s_col+1, len(self.keys1), 1)[0]
+        
         m_meta_dict = dict(zip(self.keys1_en, values))     
         return m_meta_dict
     
@@ -140,25 +242,12 @@ class ExcelConv():
         
         s_row, s_col = start_data_pos
         
-        wb = oxl.load_workbook(self.filename)
-        sheet = wb[sheet_name]
-        
-        data_title_key = []
-        for i  in range(5):
-            get_title = sheet.cell(row=s_row, column=s_col+i).value
-            data_title_key.append(get_title)
+        data_title_key = self.block_columns(sheet_name, s_row, s_col, 1, 5)
+        data_title_key = [t[0] for t in data_title_key]
         
         # print(data_title_key)
         
-        values =[]
-        for k in range(col_num):
-            value_col = []
-            for j in range(length):
-                get_value = sheet.cell(row=j+1+s_row, column=s_col+k).value
-                value_col.append(get_value)  
-            values.append(value_col)  
-        
-        wb.close()
+        values = self.block_columns(sheet_name, s_row+1, s_col, length, col_num)
             
         data_dict = dict(zip(data_title_key, values))     
         
@@ -171,8 +260,7 @@ class ExcelConv():
             # jsonfile_name =self.file_name.with_name( json_name)
             jsonfile_name =self.file_name.with_suffix('.json')
 
-        with open(jsonfile_name, 'w') as f:
-            json.dump(dict_metadata, f, indent=4,default=json_serial)
+        datjson.dump(dict_metadata, jsonfile_name, default=json_serial)
 
         json_meta = json.dumps(dict_metadata, default=json_serial)
         
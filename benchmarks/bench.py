@@ -0,0 +1,207 @@
+"""
+Throughput benchmarks of the converters
+
+Generates synthetic files (see gen_dat.py), times AcConv.convert,
+AdvAcConv.convert, datlib.dat_list_make and ExcelConv.multi_sheet_convert,
+and writes files/sec and peak memory as JSON.
+
+Usage (from the repository root):
+    python -m benchmarks.bench --count 2000 --step 0.05 --out bench_result.json
+    python -m benchmarks.bench --compare old_result.json new_result.json
+
+An older commit is measured with this benchmark and the acdatconv of
+another checkout (e.g. made with git worktree); the result records the
+commit of the tree that was actually imported:
+    git worktree add ../old_tree <commit>
+    python -m benchmarks.bench --tree ../old_tree --out old_result.json
+
+"""
+import argparse
+from contextlib import redirect_stdout
+import inspect
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.gen_dat import generate_folder, make_validation_workbook
+
+
+def use_tree(tree):
+    """Makes `import acdatconv` load the package of another checkout.
+
+    Must be called before acdatconv is imported (the module is imported by run()).
+
+    Args:
+        tree (str or pathlib): repository folder that contains acdatconv/
+    """
+    tree = Path(tree).resolve()
+    if not (tree / "acdatconv").is_dir():
+        raise ValueError(f"no acdatconv package in {tree}")
+    if "acdatconv" in sys.modules:
+        raise ValueError("acdatconv is already imported")
+    sys.path.insert(0, str(tree))
+    # worker processes of dat_list_make(jobs=...) import the same tree
+    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [str(tree), os.environ.get("PYTHONPATH")]))
+
+
+def _git_commit(package_file):
+    """Commit of the repository that contains the imported acdatconv."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(package_file).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _measure(func, n_items, repeat=3):
+    """Best wall time of `repeat` runs, then one run under tracemalloc for the peak memory.
+    An untimed first run loads the lazily imported modules (pandas, openpyxl)."""
+    with redirect_stdout(io.StringIO()):
+        func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    with redirect_stdout(io.StringIO()):
+        func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best = min(times)
+    return {"items": n_items, "seconds": best, "items_per_sec": n_items / best if best else None,
+            "peak_mem_bytes": peak, "runs": times}
+
+
+def run(count=500, step=0.05, jobs=1, sheets=20, repeat=3, seed=0):
+    """Runs all benchmarks.
+
+    Args:
+        count (int, optional): Number of synthetic .dat files. Defaults to 500.
+        step (float, optional): Energy step [eV]. Defaults to 0.05.
+        jobs (int, optional): jobs for dat_list_make. Defaults to 1.
+        sheets (int, optional): Number of sheets of the validation workbook. Defaults to 20.
+        repeat (int, optional): Timed runs per benchmark (the best is kept). Defaults to 3.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        dict: environment, parameters and results
+    """
+    import acdatconv
+    from acdatconv import datconv as dv
+    from acdatconv import datlib
+    from acdatconv.validation_excel_read import ExcelConv
+
+    # older versions of dat_list_make have no jobs argument
+    list_kwargs = {"jobs": jobs} if jobs != 1 else {}
+    if list_kwargs and "jobs" not in inspect.signature(datlib.dat_list_make).parameters:
+        raise ValueError("dat_list_make of this version has no jobs argument: use jobs=1")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        files = generate_folder(tmp / "dat", count=count, step=step, seed=seed)
+
+        def convert_all(converter):
+            for fl in files:
+                converter(fl).convert()
+
+        results["AcConv.convert"] = _measure(lambda: convert_all(dv.AcConv), count, repeat)
+        results["AdvAcConv.convert"] = _measure(lambda: convert_all(dv.AdvAcConv), count, repeat)
+        results["dat_list_make"] = _measure(
+            lambda: datlib.dat_list_make(tmp / "dat", figout=False, out_file_name=str(tmp / "list.xlsx"), **list_kwargs),
+            count, repeat)
+
+        book = tmp / "validation.xlsx"
+        make_validation_workbook(book, n_sheets=sheets, step=step, seed=seed)
+        cwd = os.getcwd()
+        # multi_sheet_convert writes one JSON per sheet into the current folder
+        os.chdir(tmp)
+        try:
+            results["ExcelConv.multi_sheet_convert"] = _measure(
+                lambda: ExcelConv(book).multi_sheet_convert(), sheets, repeat)
+        finally:
+            os.chdir(cwd)
+
+    return {
+        "commit": _git_commit(acdatconv.__file__),
+        "tree": str(Path(acdatconv.__file__).resolve().parent.parent),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "params": {"count": count, "step": step, "jobs": jobs, "sheets": sheets, "repeat": repeat, "seed": seed},
+        "results": results,
+    }
+
+
+def compare(old, new):
+    """Text table of the speed ratio new/old per benchmark.
+
+    Args:
+        old (dict): result of run() (or its JSON)
+        new (dict): result of run() (or its JSON)
+
+    Returns:
+        str: comparison table
+    """
+    lines = [f"{'benchmark':<32}{'old [/s]':>12}{'new [/s]':>12}{'speedup':>10}{'mem ratio':>11}"]
+    for name, res in new["results"].items():
+        if name not in old["results"]:
+            continue
+        o = old["results"][name]
+        speedup = res["items_per_sec"] / o["items_per_sec"]
+        mem = res["peak_mem_bytes"] / o["peak_mem_bytes"] if o["peak_mem_bytes"] else float("nan")
+        lines.append(f"{name:<32}{o['items_per_sec']:>12.1f}{res['items_per_sec']:>12.1f}{speedup:>10.2f}{mem:>11.2f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="acdatconv throughput benchmarks")
+    parser.add_argument("--count", type=int, default=500, help="number of synthetic .dat files")
+    parser.add_argument("--step", type=float, default=0.05, help="energy step [eV]")
+    parser.add_argument("--jobs", type=int, default=1, help="jobs for dat_list_make")
+    parser.add_argument("--sheets", type=int, default=20, help="sheets in the validation workbook")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the result JSON to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    parser.add_argument("--tree", help="measure the acdatconv of this checkout (e.g. an older commit)")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        old, new = (json.loads(Path(f).read_text(encoding="utf-8")) for f in args.compare)
+        print(compare(old, new))
+        return
+
+    try:
+        if args.tree:
+            use_tree(args.tree)
+        result = run(count=args.count, step=args.step, jobs=args.jobs, sheets=args.sheets,
+                     repeat=args.repeat, seed=args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+    text = json.dumps(result, indent=2)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    for name, res in result["results"].items():
+        print(f"{name:<32}{res['items_per_sec']:>10.1f} /s  peak {res['peak_mem_bytes'] / 1e3:10.1f} kB",
+              file=sys.stderr)
+    if not args.out:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Regression check of the batch fits
+
+Compares, on the bundled Datas/ files and on synthetic files (gen_dat.py):
+    - AcBatch.user_estimation with AcConv.user_estimation of each file
+      (the batch fit must agree to `tol`)
+    - auto_threshold_batch (as used by AcBatch.auto_estimation) with a
+      brute-force scan of break points on a dense grid (its squared error
+      must not be larger)
+
+Prints one line per check and exits with status 1 if any check fails.
+
+Usage (from the repository root):
+    python -m benchmarks.check_fit
+    python -m benchmarks.check_fit --data ./Datas --count 200 --grid 5000
+
+"""
+import argparse
+from contextlib import redirect_stdout
+import io
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from acdatconv import datconv as dv
+from acdatconv.datbatch import AcBatch
+from benchmarks.gen_dat import generate_folder
+
+ESTIMATE_KEYS = ["thresholdEnergy", "slope", "yslice", "bg"]
+DATA_DIR = Path(__file__).resolve().parent.parent / "Datas"
+
+
+def check_user_estimation(files, tol=1e-11):
+    """Largest difference between the batch and the per-file user fit.
+
+    Args:
+        files (list): .dat filenames
+        tol (float, optional): allowed difference, relative to max(1, |value|). Defaults to 1e-11.
+
+    Returns:
+        tuple: (ok, largest relative difference, name of that file)
+    """
+    convs = []
+    for fl in files:
+        acdata = dv.AcConv(fl)
+        with redirect_stdout(io.StringIO()):
+            acdata.convert()
+        convs.append(acdata)
+    batch = AcBatch.from_convs(convs)
+    batch.convert()
+    est = batch.estimate_value
+
+    worst, worst_file = 0.0, None
+    for i, acdata in enumerate(convs):
+        for key in ESTIMATE_KEYS:
+            single = float(acdata.estimate_value[key])
+            value = float(est[key][i])
+            if np.isnan(single) and np.isnan(value):
+                continue
+            # NaN on one side only is a failure
+            diff = abs(value - single) / max(1.0, abs(single)) if np.isfinite(value - single) else np.inf
+            if diff > worst:
+                worst, worst_file = diff, Path(acdata.file_name).name
+    return worst <= tol, worst, worst_file
+
+
+def brute_force_sse(x, y, grid=3000, min_bg=3, min_reg=3):
+    """Smallest squared error of y = bg + a*max(x - ip, 0) (a > 0) over a grid of ip.
+
+    The grid spans the break points from point min_bg-1 to point n-1-min_reg, where
+    auto_threshold_batch keeps at least min_bg points before and min_reg points
+    after the break point. (Past point n-1-min_reg the error can fall towards
+    the excluded point n-min_reg without reaching a minimum.) bg and a are the
+    exact least squares values for each ip.
+
+    Returns:
+        float: smallest squared error (inf if no candidate has a positive slope)
+    """
+    if len(x) < min_bg + min_reg:
+        return np.inf
+    ips = np.linspace(x[min_bg - 1], x[-min_reg - 1], grid)
+    u = np.maximum(x[None, :] - ips[:, None], 0)
+    u_mean = u.mean(axis=1, keepdims=True)
+    y_mean = y.mean()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        a = ((u - u_mean) * (y - y_mean)).sum(axis=1) / ((u - u_mean) ** 2).sum(axis=1)
+    bg = y_mean - a * u_mean[:, 0]
+    sse = ((bg[:, None] + a[:, None] * u - y) ** 2).sum(axis=1)
+    sse[~(a > 0)] = np.inf
+    return sse.min()
+
+
+def check_auto_threshold(files, grid=3000, tol=1e-9):
+    """Compares auto_threshold_batch with brute_force_sse on the points used by
+    AcBatch.auto_estimation.
+
+    Args:
+        files (list): .dat filenames
+        grid (int, optional): break points of the brute-force scan. Defaults to 3000.
+        tol (float, optional): allowed excess of the squared error, relative. Defaults to 1e-9.
+
+    Returns:
+        tuple: (ok, largest relative excess over the brute force, name of that file)
+    """
+    batch = AcBatch(files)
+    batch.convert()
+    est = batch.auto_estimation()
+    limits = dv.AcConv.count_limits
+    count_limit = np.array([limits.get(m, dv.AcConv.default_count_limit) for m in batch.model], dtype=float)
+    with np.errstate(invalid="ignore"):
+        cut = (batch.uvEnergy >= dv.AcConv.limit_energy) | (batch.countingCorrection >= count_limit[:, None])
+    mask = batch.mask & ~np.logical_or.accumulate(cut, axis=1)
+
+    worst, worst_file = -np.inf, None
+    for i in range(len(batch)):
+        x, y = batch.uvEnergy[i][mask[i]], batch.npyield[i][mask[i]]
+        best = brute_force_sse(x, y, grid)
+        if np.isnan(est["thresholdEnergy"][i]):
+            # no fit: the brute force must not have found one either
+            excess = 0.0 if np.isinf(best) else np.inf
+        else:
+            model = dv.AcConv.relu(xdata=x, a=est["slope"][i], b=est["yslice"][i], bg=est["bg"][i])
+            excess = (((model - y) ** 2).sum() - best) / max(best, 1e-300)
+        if excess > worst:
+            worst, worst_file = excess, Path(batch.file_name[i]).name
+    return worst <= tol, worst, worst_file
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="regression check of the batch threshold fits")
+    parser.add_argument("--data", default=str(DATA_DIR), help="folder of .dat files (default: Datas/)")
+    parser.add_argument("--count", type=int, default=100, help="number of synthetic .dat files (0: none)")
+    parser.add_argument("--grid", type=int, default=3000, help="break points of the brute-force scan")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        sets = {"data": sorted(Path(args.data).glob("*.dat"))}
+        if args.count:
+            sets["synthetic"] = generate_folder(Path(tmp) / "dat", count=args.count, seed=args.seed)
+        for name, files in sets.items():
+            if not files:
+                continue
+            for label, (ok, worst, worst_file) in (
+                    ("user_estimation batch vs AcConv", check_user_estimation(files)),
+                    ("auto_threshold_batch vs brute force", check_auto_threshold(files, args.grid))):
+                print(f"{name:<10}{label:<38}{'OK' if ok else 'FAIL':<6}worst {worst:.3g} ({worst_file})")
+                failed |= not ok
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
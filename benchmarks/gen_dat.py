@@ -0,0 +1,151 @@
+"""
+Synthetic AC .dat / validation Excel generator for the benchmarks
+
+Files follow the formats described in README.md:
+    - AC-2, AC-3 : new format 0 (counting rate after dead-time correction)
+    - AC-5, AC-2S: new format (raw counting rate)
+    - AC-5 old   : 10 parameter header, 3 fields on line 3
+Sample names can be Japanese (the file is then written in Shift-JIS).
+
+Example :
+    >>> from benchmarks.gen_dat import generate_folder
+    >>> generate_folder('./synthetic', count=1000, step=0.05)
+
+"""
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+# (model, old header)
+MODELS = [("AC-2", False), ("AC-2S", False), ("AC-3", False), ("AC-5", False), ("AC-5", True)]
+SAMPLE_NAMES = ["Au", "ITO", "PTCBI", "Quinacridone", "金蒸着膜", "試料A-1", "ペンタセン"]
+
+
+def make_dat_text(model="AC-2S", old_format=False, step=0.05, start=4.2, finish=6.8,
+                  threshold=5.2, power=0.5, sample_name="Au", seed=0, date=None):
+    """Creates the text of one synthetic .dat file.
+
+    The n-th power yield follows the ReLU model of AcConv with noise, the
+    background and regression flags are set around the threshold.
+
+    Args:
+        model (str, optional): Model name. Defaults to "AC-2S".
+        old_format (bool, optional): AC-5 old 10 parameter header. Defaults to False.
+        step (float, optional): Energy step [eV]. Defaults to 0.05.
+        start (float, optional): Start energy [eV]. Defaults to 4.2.
+        finish (float, optional): Finish energy [eV]. Defaults to 6.8.
+        threshold (float, optional): Threshold energy [eV]. Defaults to 5.2.
+        power (float, optional): Power number. Defaults to 0.5.
+        sample_name (str, optional): Sample name. Defaults to "Au".
+        seed (int, optional): Random seed. Defaults to 0.
+        date (datetime, optional): Measure date. Defaults to None (fixed date).
+
+    Returns:
+        str: file text (CRLF line ends)
+    """
+    rng = np.random.default_rng(seed)
+    energy = np.round(np.arange(start, finish + step / 2, step), 2)
+    uv59 = float(rng.choice([3.0, 10.0, 50.0]))
+    dead_time = 0.00416 if model in ("AC-2S", "AC-5") else 0.00575
+    bg_count = 0.67 if model == "AC-2S" else 0.0
+    dif_flag = int(rng.choice([0, -1]))
+
+    # n-th power yield: background + linear onset
+    slope = rng.uniform(20, 80)
+    bg = rng.uniform(1, 4)
+    npyield = bg + slope * np.clip(energy - threshold, 0, None)
+    pyield = npyield ** (1 / power)
+
+    uv_intensity = uv59 * (1.0 + 0.4 * np.sin((energy - start) * 2.0))
+    photon = 0.625 * uv_intensity / energy / (uv59 * 0.625 / 5.9)
+    counts = rng.poisson(np.clip(pyield * photon, 0, 1e6) * 10) / 10
+    if model in ("AC-2S", "AC-5"):
+        # raw counting rate before the dead-time correction
+        counts = counts / (1 + dead_time * counts)
+
+    fl_ground = np.where(energy < threshold - 0.2, -1, 0)
+    fl_reg = np.where((energy > threshold + 0.1) & (energy < threshold + 0.6), -1, 0)
+
+    params = ["PE", f"{dead_time:.6f}", "10", f"{power:.2f}", "2660.00", f"{step:.2f}", model,
+              "64.00", f"{start:.2f}", f"{finish:.2f}", str(dif_flag), f"{bg_count:.2f}"]
+    light = [f"{uv59:.2f}", f"{uv59:.2f}", f"{uv59:.0f}nW 220524104956.ldat", "1.00", "1.00"]
+    if old_format:
+        params = params[:10]
+        light = light[:3]
+    date = date or datetime(2022, 5, 24, 12, 18, 47)
+
+    lines = [",".join(params), f"{date:%Y/%m/%d %H:%M:%S},{sample_name}", ",".join(light)]
+    for row in zip(energy, counts, fl_ground, fl_reg, uv_intensity):
+        lines.append(f"{row[0]:.2f},{row[1]:.2f},{row[2]},{row[3]},{row[4]:.2f}")
+    return "\r\n".join(lines) + "\r\n"
+
+
+def write_dat(file_name, text):
+    """Writes .dat text, in Shift-JIS when it is not ASCII (as the instruments do)."""
+    encoding = "ascii" if text.isascii() else "shift_jis"
+    Path(file_name).write_bytes(text.encode(encoding))
+
+
+def generate_folder(out_dir, count=100, step=0.05, seed=0):
+    """Writes synthetic .dat files of all models and header variants.
+
+    Args:
+        out_dir (str or pathlib): output folder
+        count (int, optional): Number of files. Defaults to 100.
+        step (float, optional): Energy step [eV] (resolution). Defaults to 0.05.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        list[pathlib.Path]: written files
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    start_date = datetime(2017, 1, 1)
+    files = []
+    for i in range(count):
+        model, old_format = MODELS[i % len(MODELS)]
+        name = SAMPLE_NAMES[i % len(SAMPLE_NAMES)]
+        text = make_dat_text(model=model, old_format=old_format, step=step,
+                             threshold=float(rng.uniform(4.8, 5.8)), power=0.5 if i % 4 else 1 / 3,
+                             sample_name=name, seed=seed + i, date=start_date + timedelta(hours=7 * i))
+        fl = out_dir / f"{name} {i:06d}.dat"
+        write_dat(fl, text)
+        files.append(fl)
+    return files
+
+
+def make_validation_workbook(file_name, n_sheets=10, step=0.05, seed=0):
+    """Writes a workbook in the layout read by ExcelConv (one measurement per sheet).
+
+    Args:
+        file_name (str or pathlib): output .xlsx
+        n_sheets (int, optional): Number of sheets. Defaults to 10.
+        step (float, optional): Energy step [eV]. Defaults to 0.05.
+        seed (int, optional): Random seed. Defaults to 0.
+    """
+    import openpyxl as oxl
+    from acdatconv.validation_excel_read import ExcelConv
+
+    rng = np.random.default_rng(seed)
+    wb = oxl.Workbook()
+    wb.remove(wb.active)
+    start, finish = 4.5, 6.2
+    energy = np.round(np.arange(start, finish + step / 2, step), 2)
+    for s in range(n_sheets):
+        ws = wb.create_sheet(f"Sheet{s + 1}")
+        yld = np.round(rng.uniform(1, 20) + rng.uniform(20, 80) * np.clip(energy - 5.2, 0, None) ** 2, 2)
+        values = [f"sample{s}", datetime(2021, 3, 11, 13, 28, 24), 9.9, "10nW_210304", 10, 2990, 0.00555,
+                  start, finish, step, 5.32, 55.82, 0.5, 4.67, "無効"]
+        # same positions as the validation sheets (A40: keys, D40: data)
+        for i, (key, value) in enumerate(zip(ExcelConv.keys1, values)):
+            ws.cell(row=40 + i, column=1, value=key)
+            ws.cell(row=40 + i, column=2, value=value)
+        for j, title in enumerate(ExcelConv.key_data):
+            ws.cell(row=40, column=4 + j, value=title)
+        for i, (e, y) in enumerate(zip(energy, yld)):
+            ws.cell(row=41 + i, column=4, value=float(e))
+            ws.cell(row=41 + i, column=5, value=float(y))
+            ws.cell(row=41 + i, column=6, value=round(float(y) ** 0.5, 2))
+    wb.save(file_name)
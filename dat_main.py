@@ -1,83 +1,164 @@
 
-from pathlib import Path
-from tempfile import NamedTemporaryFile
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import io
-# import zipfile
+import zipfile
 
+import pandas as pd
 import streamlit as st
-import matplotlib.pyplot as plt
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from matplotlib.figure import Figure
 import japanize_matplotlib
 
 from acdatconv import datconv as dv
 from acdatconv import datlib as dlib
 
-st.title('AC Dat File Converter')
+# Conversions and rendered files kept per content hash (shared by all sessions)
+CACHE_ENTRIES = 512
+# Threads converting the uploads of one run
+WORKERS = 8
+# Columns of the threshold summary table
+SUMMARY_KEYS = ["file_name", "sampleName", "model", "measureDate", "powerNumber", "uvIntensity59",
+                "thresholdEnergy", "slope", "bg"]
 
-# Fileの拡張子をチェックしてくる
-uploaded_file = st.file_uploader("dat file upload", type='dat')
 
+@st.cache_data(max_entries=CACHE_ENTRIES, show_spinner=False)
+def convert_upload(digest, file_name, _data):
+    """Converts uploaded .dat contents in memory (cached by content hash and name)."""
+    acdata = dv.AcConv.from_bytes(_data, file_name)
+    acdata.convert()
+    return acdata
 
-if uploaded_file is not None:
-    file_name = uploaded_file.name
-    save_name = file_name.split('.')[0]
 
-    
-    with NamedTemporaryFile(delete=False) as f:
-        fp = Path(f.name)
-        fp.write_bytes(uploaded_file.getvalue())
-        
-        acdata = dv.AcConv(f'{f.name}')
-        acdata.convert()
-        
-    # ファイルを削除  
-    fp.unlink()
-    # st.write(acdata.estimate_value)
-    
-    fig =plt.figure() 
+def make_figure(acdata):
+    # Figure without pyplot: no global state, safe to draw in several threads
+    fig = Figure()
     ax = fig.add_subplot(111)
-    ax.set_title(f'{acdata.metadata["sampleName"]}')
-    ax.plot(acdata.df["uvEnergy"],acdata.df["npyield"],'ro-',label='Data')
-    ax.plot(acdata.df["uvEnergy"],acdata.df["guideline"],'b-',label=f'Estimate line\n {acdata.metadata["thresholdEnergy"]:.2f} eV')
+    meta = acdata.metadata_wo_calc
+    ax.set_title(f'{meta["sampleName"]}')
+    ax.plot(acdata.uvEnergy, acdata.npyield, 'ro-', label='Data')
+    ax.plot(acdata.uvEnergy, acdata.guideline, 'b-', label=f'Estimate line\n {meta["thresholdEnergy"]:.2f} eV')
     ax.legend()
     ax.grid()
     ax.set_xlabel('energy [eV]')
-    ax.set_ylabel(f'Intensity^{acdata.metadata["powerNumber"]:.2f}')
-    
+    ax.set_ylabel(f'Intensity^{meta["powerNumber"]:.2f}')
+    return fig
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES, show_spinner=False)
+def render_outputs(digest, file_name, _acdata):
+    """PNG, CSV and JSON payloads of a converted file (cached by content hash and name)."""
     # メモリに保存
     img = io.BytesIO()
-    plt.savefig(img, format='png')
-    
-    st.pyplot(fig)
-    
-    csv = acdata.df[["uvEnergy","pyield","npyield",	"nayield","guideline"]].to_csv(index=False)
-    json = acdata.json
+    make_figure(_acdata).savefig(img, format='png')
+    csv = _acdata.df[["uvEnergy","pyield","npyield","nayield","guideline"]].to_csv(index=False)
+    return {'png': img.getvalue(), 'csv': csv, 'json': _acdata.json}
+
+
+def process_upload(upload):
+    """Converts and renders one upload.
+
+    Returns:
+        tuple (str, str, AcConv, dict, str): digest, file name, converted data,
+            payloads, error message (None if no error)
+    """
+    data = upload.getvalue()
+    digest = hashlib.sha256(data).hexdigest()
+    try:
+        acdata = convert_upload(digest, upload.name, data)
+        return digest, upload.name, acdata, render_outputs(digest, upload.name, acdata), None
+    except Exception as e:
+        return digest, upload.name, None, None, f'{type(e).__name__}: {e}'
+
+
+def process_uploads(uploads):
+    """Converts all uploads concurrently (input order is kept)."""
+    if len(uploads) < 2:
+        return [process_upload(u) for u in uploads]
+    # the worker threads share this session's context (cache and widgets)
+    with ThreadPoolExecutor(max_workers=WORKERS, initializer=add_script_run_ctx,
+                            initargs=(None, get_script_run_ctx())) as executor:
+        return list(executor.map(process_upload, uploads))
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def build_zip(keys, _results, summary_csv):
+    """One ZIP (in memory) with the CSV/JSON/PNG of every file and the summary table."""
+    buf = io.BytesIO()
+    used = set()
+    with zipfile.ZipFile(buf, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('summary.csv', summary_csv)
+        for _, file_name, _, outputs, _ in _results:
+            save_name = file_name.split('.')[0]
+            # same name uploaded twice: number the later ones
+            stem, n = save_name, 1
+            while stem in used:
+                n += 1
+                stem = f'{save_name}_{n}'
+            used.add(stem)
+            zf.writestr(f'{stem}.csv', outputs['csv'])
+            zf.writestr(f'{stem}.json', outputs['json'])
+            # PNG is already compressed
+            zf.writestr(f'{stem}.png', outputs['png'], compress_type=zipfile.ZIP_STORED)
+    return buf.getvalue()
+
+
+st.title('AC Dat File Converter')
+
+# Fileの拡張子をチェックしてくる
+uploaded_files = st.file_uploader("dat file upload", type='dat', accept_multiple_files=True)
+
+
+if uploaded_files:
+    # 一時ファイルを使わずメモリ上で並列に変換する
+    results = process_uploads(uploaded_files)
+    for _, file_name, _, _, err in results:
+        if err is not None:
+            st.warning(f'file error: {file_name} ({err})')
+    results = [r for r in results if r[4] is None]
+else:
+    results = []
+
+if results:
+    summary = pd.DataFrame([{k: acdata.metadata_wo_calc[k] for k in SUMMARY_KEYS}
+                            for _, _, acdata, _, _ in results])
+    st.dataframe(summary)
+
+    summary_csv = summary.to_csv(index=False)
+    keys = tuple((digest, file_name) for digest, file_name, _, _, _ in results)
+    st.download_button(label='Download all (zip)',
+                       data=build_zip(keys, results, summary_csv),
+                       file_name='ac_results.zip',
+                       mime='application/zip',
+                       )
+
+    names = [file_name for _, file_name, _, _, _ in results]
+    idx = st.selectbox('file', range(len(results)), format_func=lambda i: names[i])
+    _, file_name, acdata, outputs, _ = results[idx]
+    save_name = file_name.split('.')[0]
+    # st.write(acdata.estimate_value)
+
+    st.image(outputs['png'])
 
     # ボタンを横に並べるため
     col1, col2, col3 = st.columns([1,1,1])
-    
+
     with col1:
-        st.download_button(label='Download csv data', 
-                        data=csv, 
+        st.download_button(label='Download csv data',
+                        data=outputs['csv'],
                         file_name=f'{save_name}.csv',
                         mime='text/csv',
                         )
     with col2:
         st.download_button(label="Download image",
-                        data=img,
+                        data=outputs['png'],
                         file_name=f'{save_name}.png',
                         mime="image/png"
                         )
-    with col3:    
+    with col3:
         st.download_button(label ="Download json",
-                        data=json,
+                        data=outputs['json'],
                         file_name=f'{save_name}.json',
                         mime="application/json",
                         )
-    
-    # TODO: Zipでダウンロードできるようにする
-    
-
-
-        
-    
 